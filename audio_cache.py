@@ -0,0 +1,174 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from disk_cache import DiskCacheDir
+
+# --- キャッシュの既定値 ---
+DEFAULT_MEMORY_ITEMS = 32 # メモリに保持する音声の件数
+DEFAULT_DISK_MAX_BYTES = 64 * 1024 * 1024 # ディスクキャッシュの上限 (64MB)
+DEFAULT_QUERY_ITEMS = 256 # 保持するaudio_queryの件数 (1件数KBなので多めでよい)
+DEFAULT_QUERY_TTL = 24 * 60 * 60 # audio_queryの有効期限 (ユーザー辞書の更新を反映させるため)
+
+# クエリを作り直さずに変更できる韻律パラメータ
+PROSODY_KEYS = {
+    "speed_scale": "speedScale",
+    "pitch_scale": "pitchScale",
+    "intonation_scale": "intonationScale",
+    "volume_scale": "volumeScale",
+}
+
+
+class AudioCache:
+    """合成済み音声をメモリ(LRU)とディスクの2段で保持するキャッシュ"""
+
+    def __init__(self, cache_dir, memory_items=DEFAULT_MEMORY_ITEMS, disk_max_bytes=DEFAULT_DISK_MAX_BYTES):
+        self.memory_items = memory_items
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict() # key -> bytes (末尾が最近使ったもの)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk = DiskCacheDir(cache_dir, disk_max_bytes, (".wav",), "音声キャッシュ")
+        self.cache_dir = self._disk.directory # 使用できなければNone
+
+    @staticmethod
+    def make_key(text: str, speaker: int, engine_version: str, query_params: dict | None = None) -> str:
+        """テキスト・話者・エンジンバージョン・クエリ調整値からキャッシュキーを作る"""
+        material = json.dumps(
+            {"text": text, "speaker": speaker, "engine": engine_version, "params": query_params or {}},
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> bytes | None:
+        """キャッシュから音声を取り出す (なければNone)"""
+        with self._lock:
+            wav = self._memory.get(key)
+            if wav is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return wav
+
+        wav = self._read_disk(key)
+        with self._lock:
+            if wav is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, wav)
+        return wav
+
+    def put(self, key: str, wav: bytes):
+        """音声をメモリとディスクの両方に保存する"""
+        with self._lock:
+            self._remember(key, wav)
+        self._write_disk(key, wav)
+
+    def stats(self) -> dict:
+        """ヒット・ミス数と現在の使用量を返す"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk.bytes,
+            }
+
+    # --- 内部処理 ---
+    def _remember(self, key, wav):
+        """メモリ層に追加し、上限を超えた古いものから捨てる (ロック取得済みで呼ぶ)"""
+        self._memory[key] = wav
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk.path(f"{key}.wav")
+        try:
+            with open(path, "rb") as f:
+                wav = f.read()
+            self._disk.touch(path)
+            return wav
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            print(f"音声キャッシュの読み込み中にエラー: {e}")
+            return None
+
+    def _write_disk(self, key, wav):
+        if not self.cache_dir or len(wav) > self.disk_max_bytes:
+            return
+
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                f.write(wav)
+
+        self._disk.write(f"{key}.wav", write)
+
+
+def adjust_query(query: dict, speed_scale=None, pitch_scale=None, intonation_scale=None, volume_scale=None,
+                 overrides: dict | None = None) -> dict:
+    """キャッシュ済みのクエリを複製し、話速・音高・抑揚・音量などを上書きする (/audio_queryは呼ばない)"""
+    adjusted = copy.deepcopy(query)
+    values = {"speed_scale": speed_scale, "pitch_scale": pitch_scale,
+              "intonation_scale": intonation_scale, "volume_scale": volume_scale}
+    for name, value in values.items():
+        if value is not None:
+            adjusted[PROSODY_KEYS[name]] = value
+    if overrides:
+        adjusted.update(overrides)
+    return adjusted
+
+
+class QueryCache:
+    """audio_queryの結果 (アクセント・モーラ解析) を保持するLRUキャッシュ (有効期限つき)"""
+
+    def __init__(self, max_items=DEFAULT_QUERY_ITEMS, ttl_seconds=DEFAULT_QUERY_TTL):
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (保存時刻, クエリ)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text: str, speaker: int, engine_version: str) -> str:
+        """解析結果はテキスト・話者・エンジンで決まるので、それだけをキーにする"""
+        return f"{engine_version}\x00{speaker}\x00{text}"
+
+    def get(self, key: str) -> dict | None:
+        """クエリの複製を返す (呼び出し側で書き換えてもキャッシュは変わらない)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key] # 期限切れ
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            query = entry[1]
+        return copy.deepcopy(query)
+
+    def put(self, key: str, query: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), copy.deepcopy(query))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "items": len(self._entries)}
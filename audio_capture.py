@@ -0,0 +1,268 @@
+import queue
+import threading
+
+import numpy as np
+import speech_recognition as sr
+
+# --- 録音・発話区間検出の既定値 ---
+DEFAULT_BUFFER_SECONDS = 30 # リングバッファに保持する録音の長さ
+DEFAULT_PRE_ROLL = 0.3 # 発話開始と判定した位置より前に含める長さ (語頭の欠けを防ぐ)
+DEFAULT_SPEECH_START = 0.1 # この長さ以上続けて閾値を超えたら発話開始とみなす
+DEFAULT_PAUSE = 0.6 # この長さ以上静かになったら発話終了とみなす
+DEFAULT_MIN_UTTERANCE = 0.3 # これより短い発話は物音として捨てる
+DEFAULT_MAX_UTTERANCE = 5.0 # 発話がこれより長くなったら区切る
+DEFAULT_NOISE_UPDATE = 1.0 # 発話のない音がこの長さたまるごとにノイズレベルを更新する (noise_trackerの再調整間隔がなければ使う)
+DEFAULT_BARGE_IN = 0.3 # 再生中は、この長さ以上続けて声を検出したら割り込みとみなす
+DEFAULT_ECHO_MARGIN = 3.0 # 再生音の回り込みの見積もりに対して、この倍率を超えた音を利用者の声とみなす
+
+
+class Utterance(sr.AudioData):
+    """切り出した発話 (リングバッファ上の総フレーム番号の範囲を持つ)"""
+
+    def __init__(self, frame_data, sample_rate, sample_width, start_frame, end_frame):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.start_frame = start_frame # 先行部分を含めた開始位置
+        self.end_frame = end_frame
+
+
+class EchoGate:
+    """再生中にマイクへ回り込む音と利用者の声を、再生した音の大きさと比べて見分ける"""
+
+    def __init__(self, margin=DEFAULT_ECHO_MARGIN, initial_coupling=1.0, adapt_rate=0.05):
+        self.margin = margin
+        self.coupling = initial_coupling # 回り込みの割合 (マイクの音量 / 再生した音量)。再生中に学習する
+        self.adapt_rate = adapt_rate
+
+    def is_speech(self, mic_energy, output_energy, threshold) -> bool:
+        expected_echo = self.coupling * output_energy
+        speech = mic_energy > threshold and mic_energy > expected_echo * self.margin
+        if not speech and output_energy > 0:
+            # 再生音だけが聞こえているとみなし、回り込みの割合を少しずつ合わせる
+            self.coupling += (mic_energy / output_energy - self.coupling) * self.adapt_rate
+        return speech
+
+
+class CaptureService:
+    """マイクを開いたまま録音し続け、発話区間を切り出してキューに積む"""
+
+    def __init__(self, microphone: sr.Microphone, recognizer: sr.Recognizer, noise_tracker=None,
+                 buffer_seconds=DEFAULT_BUFFER_SECONDS, pre_roll=DEFAULT_PRE_ROLL,
+                 speech_start_duration=DEFAULT_SPEECH_START, pause_duration=DEFAULT_PAUSE,
+                 min_utterance_duration=DEFAULT_MIN_UTTERANCE, max_utterance_duration=DEFAULT_MAX_UTTERANCE,
+                 noise_update_seconds=None, suppress=None,
+                 on_barge_in=None, echo_reference=None, barge_in_duration=DEFAULT_BARGE_IN,
+                 echo_margin=DEFAULT_ECHO_MARGIN):
+        self.microphone = microphone
+        self.recognizer = recognizer # energy_thresholdを発話判定の閾値に使う
+        self.noise_tracker = noise_tracker
+        self.buffer_seconds = buffer_seconds
+        self.pre_roll = pre_roll
+        self.speech_start_duration = speech_start_duration
+        self.pause_duration = pause_duration
+        self.min_utterance_duration = min_utterance_duration
+        self.max_utterance_duration = max_utterance_duration
+        if noise_update_seconds is None: # 指定がなければ、noise_trackerの再調整間隔に合わせる
+            noise_update_seconds = getattr(noise_tracker, "recalibration_interval", DEFAULT_NOISE_UPDATE)
+        self.noise_update_seconds = noise_update_seconds
+        self.suppress = suppress # Trueを返す間 (自分の発話中など) の発話は捨てる
+        # 割り込み (barge-in): suppress中でも、回り込みを超える声が続いたらon_barge_inを呼んで発話として扱う
+        self.on_barge_in = on_barge_in
+        self.echo_reference = echo_reference # 直近の再生音量を返す関数
+        self.barge_in_duration = barge_in_duration
+        self.echo_gate = EchoGate(echo_margin)
+
+        self.sample_rate = None
+        self.sample_width = None
+        self.utterances = queue.Queue() # 切り出した発話 (sr.AudioData)
+        self._lock = threading.Lock()
+        self._buffer = None
+        self._capacity = 0
+        self._written = 0 # これまでに録音した総フレーム数
+        self._speech_start = None # 発話中なら先行部分を含めた開始位置 (自分の発話中の音ならNone)
+        self._stats = {"utterances": 0, "suppressed": 0, "too_short": 0, "barge_ins": 0}
+
+        self._running = threading.Event()
+        self._ready = threading.Event()
+        self._thread = None
+
+    # --- 公開API ---
+    def start(self, timeout=3) -> bool:
+        """録音スレッドを開始し、マイクが開けたかどうかを返す"""
+        if self._thread is None:
+            self._running.set()
+            self._thread = threading.Thread(target=self._run, name="audio-capture", daemon=True)
+            self._thread.start()
+        return self._ready.wait(timeout) and self.running
+
+    @property
+    def running(self) -> bool:
+        return self._running.is_set() and self._thread is not None and self._thread.is_alive()
+
+    @property
+    def written(self) -> int:
+        """これまでに録音した総フレーム数"""
+        return self._written
+
+    def current_speech_start(self) -> int | None:
+        """発話の途中なら、その開始位置 (先行部分を含む総フレーム番号) を返す"""
+        return self._speech_start
+
+    def get_utterance(self, timeout=None) -> Utterance | None:
+        """次の発話を取り出す (timeout秒以内になければNone)"""
+        try:
+            return self.utterances.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def clear(self):
+        """まだ取り出されていない発話を捨てる"""
+        while True:
+            try:
+                self.utterances.get_nowait()
+            except queue.Empty:
+                return
+
+    def read_frames(self, start, end) -> np.ndarray:
+        """総フレーム番号start〜endの録音を返す (リングバッファから消えた部分は切り詰める)"""
+        with self._lock:
+            start = max(start, self._written - self._capacity, 0)
+            end = min(end, self._written)
+            if end <= start:
+                return np.empty(0, dtype=np.int16)
+            first = start % self._capacity
+            count = end - start
+            if first + count <= self._capacity:
+                return self._buffer[first:first + count].copy()
+            return np.concatenate((self._buffer[first:], self._buffer[:first + count - self._capacity]))
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    def stop(self, timeout=1):
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    # --- 内部処理 ---
+    def _run(self):
+        try:
+            with self.microphone as source:
+                self.sample_rate = source.SAMPLE_RATE
+                self.sample_width = source.SAMPLE_WIDTH
+                with self._lock:
+                    self._capacity = int(self.sample_rate * self.buffer_seconds)
+                    self._buffer = np.zeros(self._capacity, dtype=np.int16)
+                    self._written = 0
+                self._ready.set()
+                detector = _UtteranceDetector(self)
+                while self._running.is_set():
+                    detector.process(self._append(source.stream.read(source.CHUNK)))
+        except Exception as e:
+            print(f"マイクからの録音中にエラー: {e}")
+        finally:
+            self._running.clear()
+            self._ready.set()
+
+    def _append(self, data: bytes) -> np.ndarray:
+        """録音したチャンクをリングバッファに書き込む"""
+        samples = np.frombuffer(data, dtype=np.int16)
+        with self._lock:
+            start = self._written % self._capacity
+            first = min(len(samples), self._capacity - start)
+            self._buffer[start:start + first] = samples[:first]
+            if len(samples) > first: # 末尾で折り返す
+                self._buffer[:len(samples) - first] = samples[first:]
+            self._written += len(samples)
+        return samples
+
+    def _with_pre_roll(self, start):
+        return max(start - int(self.pre_roll * self.sample_rate), 0)
+
+    def _emit(self, start, end, suppressed):
+        """発話区間を切り出してキューに積む"""
+        if suppressed:
+            self._stats["suppressed"] += 1
+            return
+        if end - start < self.min_utterance_duration * self.sample_rate:
+            self._stats["too_short"] += 1
+            return
+        start = self._with_pre_roll(start)
+        frames = self.read_frames(start, end)
+        self._stats["utterances"] += 1
+        self.utterances.put(Utterance(frames.tobytes(), self.sample_rate, self.sample_width, start, end))
+
+
+class _UtteranceDetector:
+    """チャンクごとの音量で発話の開始・終了を判定する (録音スレッド専用)"""
+
+    def __init__(self, capture: CaptureService):
+        self.capture = capture
+        rate = capture.sample_rate
+        self.start_frames = int(capture.speech_start_duration * rate)
+        self.pause_frames = int(capture.pause_duration * rate)
+        self.max_frames = int(capture.max_utterance_duration * rate)
+        self.barge_in_frames = int(capture.barge_in_duration * rate)
+        self.noise_frames = int(capture.noise_update_seconds * rate)
+        self.first_noise_frames = int(min(capture.noise_update_seconds, DEFAULT_NOISE_UPDATE) * rate) # 初回は早めに調整する
+        self.voiced_run = 0 # 発話前: 閾値を超えて続いているフレーム数
+        self.silence_run = 0 # 発話中: 閾値を下回って続いているフレーム数
+        self.speech_start = None # 発話中なら開始位置の総フレーム番号
+        self.suppressed = False
+        self.idle_chunks = []
+        self.idle_frames = 0
+
+    def process(self, samples: np.ndarray):
+        capture = self.capture
+        end = capture._written
+        energy = np.sqrt(np.mean(np.square(samples, dtype=np.float64))) if len(samples) else 0.0
+        threshold = capture.recognizer.energy_threshold
+        playing = bool(capture.suppress and capture.suppress())
+        barge_in = playing and capture.on_barge_in is not None and capture.echo_reference is not None
+        if barge_in:
+            voiced = capture.echo_gate.is_speech(energy, capture.echo_reference(), threshold)
+        else:
+            voiced = energy > threshold
+
+        if self.speech_start is None:
+            if voiced:
+                self.voiced_run += len(samples)
+                if self.voiced_run >= (self.barge_in_frames if barge_in else self.start_frames):
+                    self.speech_start = end - self.voiced_run
+                    self.silence_run = 0
+                    self.suppressed = playing and not barge_in
+                    if barge_in:
+                        capture._stats["barge_ins"] += 1
+                        capture.on_barge_in() # 再生を止めてもらい、この声を次の発話として扱う
+                    if not self.suppressed:
+                        capture._speech_start = capture._with_pre_roll(self.speech_start)
+            else:
+                self.voiced_run = 0
+                self._feed_noise(samples)
+            return
+
+        self.silence_run = 0 if voiced else self.silence_run + len(samples)
+        if self.silence_run >= self.pause_frames:
+            self._finish(end - self.silence_run + self.pause_frames // 2)
+        elif end - self.speech_start >= self.max_frames:
+            self._finish(end)
+
+    def _finish(self, end):
+        self.capture._emit(self.speech_start, end, self.suppressed)
+        self.capture._speech_start = None
+        self.speech_start = None
+        self.voiced_run = 0
+
+    def _feed_noise(self, samples):
+        """発話のない音をまとめてノイズレベルの推定に使う (自分の発話中の音は使わない)"""
+        capture = self.capture
+        if capture.noise_tracker is None or (capture.suppress and capture.suppress()):
+            self.idle_chunks = []
+            self.idle_frames = 0
+            return
+        self.idle_chunks.append(samples)
+        self.idle_frames += len(samples)
+        if self.idle_frames >= (self.noise_frames if capture.noise_tracker.is_calibrated else self.first_noise_frames):
+            capture.noise_tracker.observe(np.concatenate(self.idle_chunks), capture.sample_rate, capture.sample_width)
+            self.idle_chunks = []
+            self.idle_frames = 0
@@ -0,0 +1,281 @@
+import queue
+import threading
+import time
+from collections import deque
+
+import numpy as np
+import sounddevice as sd
+
+from wav_utils import decode_wav
+
+# --- 再生サービスの既定値 ---
+DEFAULT_SAMPLE_RATE = 24000 # VOICEVOXのデフォルトサンプリングレート
+DEFAULT_BUFFER_SECONDS = 30 # リングバッファに保持できる音声の長さ
+DEFAULT_BLOCKSIZE = 1024 # コールバック1回あたりのフレーム数
+DEFAULT_MAX_PENDING = 64 # 書き込み待ちにできる音声の数 (超えた分は再生しない)
+OUTPUT_HISTORY_BLOCKS = 256 # 出力音量の履歴として保持するブロック数 (エコー判定用)
+
+
+def _to_int16(samples: np.ndarray) -> np.ndarray:
+    """出力ストリーム用にint16へ揃える (int16ならそのまま)"""
+    if samples.dtype == np.int16:
+        return samples
+    if samples.dtype == np.uint8:
+        return ((samples.astype(np.int16) - 128) << 8).astype(np.int16)
+    if samples.dtype == np.int32:
+        return (samples >> 16).astype(np.int16)
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16) # float32/float64
+
+
+class PlaybackService:
+    """出力デバイスを開いたまま保持し、キューに積まれた音声を途切れなく再生する"""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE, channels=1, device=None,
+                 buffer_seconds=DEFAULT_BUFFER_SECONDS, blocksize=DEFAULT_BLOCKSIZE, max_pending=DEFAULT_MAX_PENDING):
+        self.device = device
+        self.blocksize = blocksize
+        self.buffer_seconds = buffer_seconds
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.stream = None
+
+        self._lock = threading.Lock()
+        self._space_available = threading.Condition(self._lock) # バッファに空きができたら通知
+        self._drained = threading.Condition(self._lock) # 再生待ちがなくなったら通知
+        self._written = 0 # これまでに書き込んだ総フレーム数
+        self._read = 0 # これまでに再生した総フレーム数
+        self._pending_callbacks = [] # (終了位置のフレーム番号, コールバック)
+        self._start_marks = [] # (開始位置のフレーム番号, 音が出始めたときのコールバック)
+        self._queued = 0 # 書き込み待ちの音声とコールバックの数
+        self._generation = 0 # interruptのたびに増やし、書き込み途中の音声を打ち切る
+        self._output_history = deque(maxlen=OUTPUT_HISTORY_BLOCKS) # (出力した時刻, ブロックの音量)
+        self._allocate_buffer()
+
+        # 完了コールバックはオーディオスレッドの外で呼ぶ
+        self._events = queue.Queue()
+        threading.Thread(target=self._dispatch_events, daemon=True).start()
+        # デバイスの開き直しやバッファの空き待ちは書き込みスレッドで行い、enqueueを呼んだスレッドを止めない
+        self._inbox = queue.Queue(maxsize=max_pending)
+        threading.Thread(target=self._write_pending, daemon=True).start()
+
+    def _allocate_buffer(self):
+        self._capacity = int(self.sample_rate * self.buffer_seconds)
+        self._buffer = np.zeros((self._capacity, self.channels), dtype=np.int16)
+
+    # --- 公開API ---
+    def enqueue(self, wav_data: bytes | None, on_done=None, on_start=None) -> bool:
+        """WAVを再生キューに追加する (待たずにすぐ戻る。asyncioのループ上からも呼べる)。on_doneは再生完了または中断時に呼ばれる
+        on_startはこの音声を出力し始めたときにオーディオスレッドから呼ばれる (時刻の記録など軽い処理だけにする。中断されたら呼ばれない)"""
+        if wav_data is None:
+            return False
+        try:
+            samples, sample_rate = decode_wav(wav_data)
+        except ValueError as e:
+            print(f"\n音声データの解析エラー: {e}")
+            return False
+        samples = _to_int16(samples)
+        if samples.ndim == 1:
+            samples = samples.reshape(-1, 1)
+
+        with self._lock:
+            generation = self._generation
+        if not self._put((samples, sample_rate, generation, on_done, on_start)):
+            print("\n再生待ちの音声が多すぎるため、この音声は再生しません。")
+            return False
+        return True
+
+    def call_when_done(self, callback):
+        """現在キューにある音声 (書き込み待ちの分も含む) を再生し終えたらcallbackを呼ぶ"""
+        if not self._put((None, None, None, callback, None)):
+            self._events.put(callback)
+
+    def wait(self, timeout=None) -> bool:
+        """キューの音声をすべて再生し終えるまで待つ"""
+        with self._lock:
+            return self._drained.wait_for(self._idle, timeout)
+
+    def interrupt(self):
+        """再生中・再生待ちの音声をすべて破棄する (割り込み用)"""
+        with self._lock:
+            self._generation += 1
+            self._read = self._written
+            self._start_marks = []
+            self._fire_finished_callbacks()
+            self._space_available.notify_all()
+            self._drained.notify_all()
+
+    def output_energy(self, window=0.3) -> float:
+        """直近window秒に出力した音の最大音量 (RMS) を返す (マイクへの回り込みの見積もりに使う)"""
+        since = time.monotonic() - window
+        with self._lock:
+            return max((energy for played_at, energy in self._output_history if played_at >= since), default=0.0)
+
+    def is_playing(self) -> bool:
+        with self._lock:
+            return not self._idle()
+
+    def close(self):
+        """出力ストリームを閉じる"""
+        self.interrupt()
+        if self.stream is not None:
+            try:
+                self.stream.stop()
+                self.stream.close()
+            except Exception as e:
+                print(f"出力ストリームの終了中にエラー: {e}")
+            self.stream = None
+
+    # --- 内部処理 ---
+    def _idle(self) -> bool:
+        """再生中・書き込み待ちの音声がない (ロック取得済みで呼ぶ)"""
+        return self._written == self._read and self._queued == 0
+
+    def _put(self, item) -> bool:
+        """書き込みスレッドに渡す (待ちが上限に達していればFalse)"""
+        with self._lock:
+            self._queued += 1
+        try:
+            self._inbox.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._queued -= 1
+            return False
+        return True
+
+    def _write_pending(self):
+        """書き込みスレッド: 渡された順に、音声をリングバッファへ書き込み、コールバックを登録する"""
+        while True:
+            samples, sample_rate, generation, callback, on_start = self._inbox.get()
+            try:
+                if samples is None:
+                    self._register_callback(callback)
+                elif self._play(samples, sample_rate, generation, on_start):
+                    if callback is not None:
+                        self._register_callback(callback)
+                elif callback is not None:
+                    self._events.put(callback) # 書き込む前・書き込み中に中断された
+            finally:
+                with self._lock:
+                    self._queued -= 1
+                    if self._idle():
+                        self._drained.notify_all()
+
+    def _play(self, samples, sample_rate, generation, on_start=None) -> bool:
+        with self._lock:
+            if self._generation != generation:
+                return False
+        try:
+            self._ensure_stream(sample_rate, samples.shape[1])
+        except Exception as e:
+            print(f"\n音声再生エラー: {e}")
+            print("利用可能なオーディオデバイスを確認してください。")
+            return False
+        if on_start is not None:
+            with self._lock:
+                if self._generation != generation:
+                    return False
+                self._start_marks.append((self._written, on_start))
+        return self._write(samples, generation)
+
+    def _register_callback(self, callback):
+        """リングバッファに書き込んだ音声を再生し終えたらcallbackを呼ぶ"""
+        with self._lock:
+            if self._written == self._read:
+                self._events.put(callback)
+            else:
+                self._pending_callbacks.append((self._written, callback))
+
+    def _ensure_stream(self, sample_rate, channels):
+        """ストリームを開く。形式が変わった場合だけ、再生し終えてから開き直す (書き込みスレッドから呼ぶ)"""
+        if self.stream is not None and (sample_rate, channels) == (self.sample_rate, self.channels):
+            return
+        if self.stream is not None:
+            with self._lock:
+                self._drained.wait_for(lambda: self._written == self._read)
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+        with self._lock:
+            if (sample_rate, channels) != (self.sample_rate, self.channels):
+                self.sample_rate = sample_rate
+                self.channels = channels
+                self._allocate_buffer()
+            self._written = self._read = 0
+        self.stream = sd.OutputStream(
+            samplerate=self.sample_rate,
+            channels=self.channels,
+            dtype="int16",
+            blocksize=self.blocksize,
+            device=self.device,
+            callback=self._callback
+        )
+        self.stream.start()
+
+    def _write(self, samples, generation) -> bool:
+        """リングバッファに書き込む。空きが足りなければ再生が進むのを待つ (中断されたらFalse)"""
+        offset = 0
+        total = len(samples)
+        while offset < total:
+            with self._lock:
+                self._space_available.wait_for(
+                    lambda: self._written - self._read < self._capacity or self._generation != generation
+                )
+                if self._generation != generation:
+                    return False
+                free = self._capacity - (self._written - self._read)
+                count = min(free, total - offset)
+                start = self._written % self._capacity
+                first = min(count, self._capacity - start)
+                self._buffer[start:start + first] = samples[offset:offset + first]
+                if count > first: # 末尾で折り返す
+                    self._buffer[:count - first] = samples[offset + first:offset + count]
+                self._written += count
+            offset += count
+        return True
+
+    def _callback(self, outdata, frames, time_info, status):
+        """オーディオスレッドから呼ばれ、リングバッファの内容を出力する"""
+        with self._lock:
+            count = min(frames, self._written - self._read)
+            start = self._read % self._capacity
+            first = min(count, self._capacity - start)
+            outdata[:first] = self._buffer[start:start + first]
+            if count > first:
+                outdata[first:count] = self._buffer[:count - first]
+            outdata[count:] = 0 # 再生するものがなければ無音
+            if count:
+                block = outdata[:count].astype(np.float32)
+                self._output_history.append((time.monotonic(), float(np.sqrt(np.mean(block * block)))))
+                self._read += count
+                self._fire_start_marks()
+                self._fire_finished_callbacks()
+                self._space_available.notify_all()
+                if self._written == self._read:
+                    self._drained.notify_all()
+
+    def _fire_start_marks(self):
+        """出力し始めた音声のon_startを呼ぶ (オーディオスレッドで、ロック取得済みで呼ぶ)"""
+        while self._start_marks and self._start_marks[0][0] < self._read:
+            _, on_start = self._start_marks.pop(0)
+            try:
+                on_start()
+            except Exception as e:
+                print(f"再生開始コールバックでエラー: {e}")
+
+    def _fire_finished_callbacks(self):
+        """再生位置を過ぎたコールバックを通知キューに移す (ロック取得済みで呼ぶ)"""
+        remaining = []
+        for end, callback in self._pending_callbacks:
+            if end <= self._read:
+                self._events.put(callback)
+            else:
+                remaining.append((end, callback))
+        self._pending_callbacks = remaining
+
+    def _dispatch_events(self):
+        while True:
+            callback = self._events.get()
+            try:
+                callback()
+            except Exception as e:
+                print(f"再生完了コールバックでエラー: {e}")
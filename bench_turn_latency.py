@@ -0,0 +1,308 @@
+# 会話1ターン (音声認識 → 応答生成 → audio_query → synthesis → 再生) のレイテンシ計測
+# 録音済みの音声を各バージョンのパイプラインに流し、段階ごと・全体のp50/p95/p99をJSONに保存する。
+# 文単位の合成パイプライン (speech_pipeline) を持つバージョンは、実際の会話と同じくイベントループ上の
+# speak_async (--speak-mode stream なら speak_stream_async) で合成・再生し、最初の文を再生に渡すまで (first_chunk) と
+# 出力デバイスに音を渡し始めるまで (first_sound) の時間も記録する。
+# 使い方: python bench_turn_latency.py --repeat 20 --output bench_result.json
+#         (実エンジンで計測する場合は --engine real、Google音声認識も通す場合は --online)
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import types
+
+BASE_PATH = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FIXTURES = os.path.join(BASE_PATH, "bench_fixtures", "turns.json")
+
+# 比較するバージョン (名前 -> ファイル)
+VARIANTS = {
+    "途中経過ver1": "途中経過ver1.py",
+    "軽量版ver2": "軽量版ver2.py",
+    "軽量版ver.5": "軽量版ver.5.py",
+}
+STAGES = ("recognize_speech_from_mic", "generate_response", "post_audio_query", "post_synthesis", "play_wavfile")
+PIPELINE_STAGES = ("recognize_speech_from_mic", "generate_response", "first_chunk", "first_sound", "speak") # speech_pipelineを使うバージョン
+
+
+# --- 音声デバイスの代わり ---
+def make_null_sounddevice(realtime=False):
+    """音を出さないsounddevice互換モジュール (realtime=Trueなら再生時間ぶん待つ)"""
+    import numpy as np
+
+    module = types.ModuleType("sounddevice")
+    state = {"seconds": 0.0}
+
+    def play(data, samplerate=None, **kwargs):
+        state["seconds"] = len(data) / samplerate if samplerate else 0.0
+
+    def wait(ignore_errors=True):
+        if realtime:
+            time.sleep(state["seconds"])
+        state["seconds"] = 0.0
+
+    def stop(ignore_errors=True):
+        state["seconds"] = 0.0
+
+    class OutputStream:
+        def __init__(self, samplerate=None, channels=1, dtype="int16", blocksize=1024, device=None, callback=None, **kwargs):
+            self.samplerate = samplerate
+            self.channels = channels
+            self.dtype = dtype
+            self.blocksize = blocksize or 1024
+            self.callback = callback
+            self._running = False
+
+        def start(self):
+            self._running = True
+            threading.Thread(target=self._run, daemon=True).start()
+
+        def _run(self):
+            outdata = np.zeros((self.blocksize, self.channels), dtype=self.dtype)
+            interval = self.blocksize / self.samplerate if realtime else 0.0005
+            while self._running:
+                self.callback(outdata, self.blocksize, None, None)
+                time.sleep(interval)
+
+        def stop(self):
+            self._running = False
+
+        def close(self):
+            self._running = False
+
+    module.play = play
+    module.wait = wait
+    module.stop = stop
+    module.OutputStream = OutputStream
+    return module
+
+
+# --- 録音済み音声をマイクの代わりに使う ---
+def make_fixture_classes(sr):
+    class FixtureMicrophone(sr.Microphone):
+        """WAVファイルを読み出すマイク (recognize_speech_from_micの型チェックを通すため継承する)"""
+
+        def __init__(self, wav_bytes: bytes):
+            self._source = sr.AudioFile(io.BytesIO(wav_bytes)) # PyAudioは使わない
+
+        def __enter__(self):
+            return self._source.__enter__()
+
+        def __exit__(self, exc_type, exc_value, traceback):
+            return self._source.__exit__(exc_type, exc_value, traceback)
+
+    class FixtureRecognizer(sr.Recognizer):
+        """オフライン時は、Google音声認識の代わりに録音に対応する書き起こしを返す"""
+
+        def __init__(self, offline=True):
+            super().__init__()
+            self.offline = offline
+            self.transcript = None
+
+        def recognize_google(self, audio_data, *args, **kwargs):
+            if self.offline:
+                return self.transcript
+            return super().recognize_google(audio_data, *args, **kwargs)
+
+    return FixtureMicrophone, FixtureRecognizer
+
+
+def load_fixtures(path):
+    """録音と書き起こしの一覧を読み込む (audioがなければ代替エンジンの合成音で作る)"""
+    from mock_voicevox_engine import build_audio_query, synthesize
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    fixtures = []
+    for entry in entries:
+        transcript = entry["transcript"]
+        if entry.get("audio"):
+            with open(os.path.join(os.path.dirname(path), entry["audio"]), "rb") as f:
+                wav_bytes = f.read()
+        else:
+            query = build_audio_query(transcript, 0)
+            query["prePhonemeLength"] = 1.2 # ノイズ調整 (1秒) 用の無音を先頭に入れる
+            query["postPhonemeLength"] = 1.0 # 発話の終わりを検出させる
+            query["outputSamplingRate"] = 16000
+            wav_bytes = synthesize(query)
+        fixtures.append({"transcript": transcript, "wav": wav_bytes})
+    return fixtures
+
+
+def load_variant(name, filename):
+    """GUIを起動せずに各バージョンのモジュールを読み込む"""
+    spec = importlib.util.spec_from_file_location(f"bench_variant_{len(sys.modules)}", os.path.join(BASE_PATH, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- 集計 ---
+def percentile(sorted_values, p):
+    """線形補間によるパーセンタイル"""
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(samples):
+    values = sorted(samples)
+    return {
+        "n": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else None,
+        "p50_ms": percentile(values, 50) * 1000 if values else None,
+        "p95_ms": percentile(values, 95) * 1000 if values else None,
+        "p99_ms": percentile(values, 99) * 1000 if values else None,
+    }
+
+
+async def stream_pieces(text, piece_chars=4):
+    """応答を少しずつ届くテキストとして流す (LLMの逐次出力の代わり)"""
+    for start in range(0, len(text), piece_chars):
+        yield text[start:start + piece_chars]
+
+
+def speak_with_pipeline(module, text, speak_mode):
+    """バージョンのイベントループ上で文単位に合成・再生し、再生し終えるまで待つ (返り値はspeech_pipelineの計測値)"""
+    if speak_mode == "stream":
+        coro = module.speech_pipeline.speak_stream_async(stream_pieces(text))
+    else:
+        coro = module.speech_pipeline.speak_async(text)
+    metrics = module.engine_loop.submit(coro).result()
+    module.playback.wait()
+    return metrics
+
+
+def run_variant(module, fixtures, repeat, sr, offline, speak_mode="async"):
+    """1つのバージョンに全ての録音を流し、段階ごとの所要時間を集める"""
+    FixtureMicrophone, FixtureRecognizer = make_fixture_classes(sr)
+    recognizer = FixtureRecognizer(offline=offline)
+    use_pipeline = hasattr(module, "speech_pipeline")
+    timings = {stage: [] for stage in (PIPELINE_STAGES if use_pipeline else STAGES)}
+    end_to_end = []
+    failures = 0
+
+    def timed(stage, func, *args):
+        started = time.perf_counter()
+        result = func(*args)
+        timings[stage].append(time.perf_counter() - started)
+        return result
+
+    for _ in range(repeat):
+        for fixture in fixtures:
+            recognizer.transcript = fixture["transcript"]
+            started = time.perf_counter()
+            speech = timed("recognize_speech_from_mic", module.recognize_speech_from_mic,
+                           recognizer, FixtureMicrophone(fixture["wav"]))
+            response_text = timed("generate_response", module.generate_response, speech["transcription"])
+            if use_pipeline:
+                metrics = timed("speak", speak_with_pipeline, module, response_text, speak_mode)
+                if not metrics["chunks_played"] or metrics["time_to_first_sound"] is None:
+                    failures += 1
+                    continue
+                timings["first_chunk"].append(metrics["time_to_first_chunk"])
+                timings["first_sound"].append(metrics["time_to_first_sound"])
+                end_to_end.append(time.perf_counter() - started)
+                continue
+            query = timed("post_audio_query", module.post_audio_query, response_text)
+            wav = timed("post_synthesis", module.post_synthesis, query) if query else None
+            if wav is None:
+                failures += 1
+                continue
+            timed("play_wavfile", module.play_wavfile, wav)
+            end_to_end.append(time.perf_counter() - started)
+
+    result = {stage: summarize(values) for stage, values in timings.items()}
+    result["end_to_end"] = summarize(end_to_end)
+    result["failures"] = failures
+    return result
+
+
+def print_table(results):
+    print(f"\n{'バージョン':<14}{'段階':<28}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    for variant, result in results.items():
+        for stage, stats in result.items():
+            if stage == "failures" or not stats["n"]:
+                continue
+            print(f"{variant:<14}{stage:<28}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        if result["failures"]:
+            print(f"{variant:<14}失敗したターン: {result['failures']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="会話ターンのレイテンシ計測")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES, help="録音と書き起こしの一覧 (JSON)")
+    parser.add_argument("--repeat", type=int, default=10, help="各録音を流す回数")
+    parser.add_argument("--engine", choices=("mock", "real"), default="mock", help="mock: 代替エンジンを起動して使う")
+    parser.add_argument("--query-latency", type=float, default=0.05, help="代替エンジンの/audio_query遅延 (秒)")
+    parser.add_argument("--synthesis-latency", type=float, default=0.2, help="代替エンジンの/synthesis遅延 (秒)")
+    parser.add_argument("--realtime-playback", action="store_true", help="再生時間ぶん待つ (既定では再生処理の負荷だけを測る)")
+    parser.add_argument("--online", action="store_true", help="Google音声認識を実際に呼び出す")
+    parser.add_argument("--speak-mode", choices=("async", "stream"), default="async",
+                        help="speech_pipelineを使うバージョンの発話方法 (stream: 応答を少しずつ渡すspeak_stream_async)")
+    parser.add_argument("--output", default="bench_result.json", help="結果を保存するJSONファイル")
+    args = parser.parse_args()
+
+    # 音は出さない (各バージョンの読み込み前に差し替える)
+    sys.modules["sounddevice"] = make_null_sounddevice(args.realtime_playback)
+    import speech_recognition as sr
+    from audio_cache import AudioCache, QueryCache
+    from voicevox_async import AsyncVoicevoxClient
+    from voicevox_client import VoicevoxClient
+
+    server = None
+    if args.engine == "mock":
+        from mock_voicevox_engine import start_mock_engine
+        server = start_mock_engine(port=0, query_latency=args.query_latency, synthesis_latency=args.synthesis_latency)
+        print(f"代替エンジンを起動しました: port {server.server_address[1]}")
+
+    fixtures = load_fixtures(args.fixtures)
+    results = {}
+    for name in args.variants:
+        print(f"{name} を計測中... ({len(fixtures)}件 x {args.repeat}回)")
+        module = load_variant(name, VARIANTS[name])
+        if server is not None:
+            # 各バージョンの接続先を代替エンジンに向ける
+            module.voicevox = VoicevoxClient(server.server_address[0], server.server_address[1], module.speaker)
+            if hasattr(module, "async_voicevox"):
+                module.async_voicevox = AsyncVoicevoxClient(server.server_address[0], server.server_address[1], module.speaker)
+        if hasattr(module, "audio_cache"):
+            # 毎ターン合成させる (キャッシュを使わない他のバージョンと条件を揃える)
+            module.audio_cache = AudioCache(None, memory_items=0)
+            module.query_cache = QueryCache(max_items=0)
+        results[name] = run_variant(module, fixtures, args.repeat, sr, offline=not args.online, speak_mode=args.speak_mode)
+        if hasattr(module, "engine_loop"):
+            module.engine_loop.submit(module.async_voicevox.close()).result()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "engine": args.engine,
+        "query_latency": args.query_latency if server else None,
+        "synthesis_latency": args.synthesis_latency if server else None,
+        "realtime_playback": args.realtime_playback,
+        "online_recognition": args.online,
+        "speak_mode": args.speak_mode,
+        "fixtures": len(fixtures),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print_table(results)
+    print(f"\n結果を '{args.output}' に保存しました。")
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+
+from PIL import Image
+
+from disk_cache import DiskCacheDir, write_atomically
+
+# --- 縮小版キャッシュの既定値 ---
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024 # ディスクに保存する縮小版の合計サイズの上限 (256MB)
+DEFAULT_JPEG_QUALITY = 90 # 透過のない画像はJPEGで保存する (透過のある画像はPNG)
+MANIFEST_NAME = "manifest.json" # 元画像の大きさと、前回の表示領域の大きさを記録するファイル
+DERIVATIVE_EXTENSIONS = (".jpg", ".png")
+MANIFEST_FLUSH_DELAY = 2.0 # 表示領域の大きさが変わってから記録を書き出すまでの時間 (秒)。続けて変わったら最後の1回だけ書く
+
+
+class DerivativeStore:
+    """表示サイズに縮小したスライドを、元ファイル (パス・更新時刻・サイズ) と表示サイズごとにディスクへ保存する"""
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, quality=DEFAULT_JPEG_QUALITY):
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self._lock = threading.Lock()
+        self._manifest = {"display_box": None, "sources": {}} # sources: 元ファイルのキー -> 元画像の (幅, 高さ)
+        self._flush_timer = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._disk = DiskCacheDir(cache_dir, max_bytes, DERIVATIVE_EXTENSIONS, "スライドの縮小版")
+        self.cache_dir = self._disk.directory # 使用できなければNone
+        self._read_manifest()
+
+    @staticmethod
+    def source_key(slide) -> str:
+        """元ファイルのパス・更新時刻・サイズから作るキー (元ファイルが変わればキーも変わる)"""
+        material = f"{os.path.abspath(slide.path)}\x00{slide.mtime_ns}\x00{slide.file_size}"
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()[:32]
+
+    def load(self, slide, size) -> Image.Image | None:
+        """保存済みの縮小版を読み込む (なければNone)"""
+        path = self._find(slide, size)
+        if path is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with Image.open(path) as image:
+                image.load()
+            self._disk.touch(path)
+        except OSError as e:
+            print(f"スライドの縮小版の読み込み中にエラー: {e}")
+            return None
+        with self._lock:
+            self.hits += 1
+        return image
+
+    def contains(self, slide, size) -> bool:
+        return self._find(slide, size) is not None
+
+    def save(self, slide, size, image: Image.Image):
+        """縮小版を保存する (書きかけのファイルを読まれないよう、書き終えてから置き換える)"""
+        if not self.cache_dir:
+            return
+        with self._lock:
+            self._manifest["sources"][self.source_key(slide)] = list(slide.image_size) if slide.image_size else None
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            extension, image_format, options = ".png", "PNG", {}
+        else:
+            extension, image_format, options = ".jpg", "JPEG", {"quality": self.quality}
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+        write = lambda tmp_path: image.save(tmp_path, format=image_format, **options)
+        if self._disk.write(self._name(slide, size, extension), write):
+            with self._lock:
+                self.writes += 1
+
+    def validate(self, slides) -> int:
+        """今のスライドに対応しない (元ファイルが変わった・消えた) 縮小版を削除する。削除した数を返す (ファイルを調べるのでTkのスレッドからは呼ばない)"""
+        current = {self.source_key(slide): slide for slide in slides}
+        with self._lock:
+            # 元画像の大きさが記録済みなら、元ファイルを開かずに済むよう項目に反映する
+            for key, slide in current.items():
+                image_size = self._manifest["sources"].get(key)
+                if image_size and slide.image_size is None:
+                    slide.image_size = tuple(image_size)
+            self._manifest["sources"] = {key: value for key, value in self._manifest["sources"].items() if key in current}
+        if not self.cache_dir:
+            return 0
+        removed = 0
+        for path, size, _ in self._disk.entries():
+            if os.path.basename(path).split("_", 1)[0] not in current and self._disk.remove(path, size):
+                removed += 1
+        self.flush()
+        return removed
+
+    def display_box(self) -> tuple[int, int] | None:
+        """前回スライドを表示した領域の大きさ (起動時の作り直しに使う)"""
+        with self._lock:
+            box = self._manifest["display_box"]
+        return tuple(box) if box else None
+
+    def remember_display_box(self, box):
+        """スライドを表示した領域の大きさを記録する (Tkのスレッドから呼べるよう、書き出しは少し後に別スレッドで行う)"""
+        box = [int(box[0]), int(box[1])]
+        with self._lock:
+            if self._manifest["display_box"] == box:
+                return
+            self._manifest["display_box"] = box
+            if not self.cache_dir:
+                return
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+            self._flush_timer = threading.Timer(MANIFEST_FLUSH_DELAY, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """記録 (元画像の大きさと表示領域) をファイルに書き出す"""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            data = json.dumps(self._manifest)
+        if not self.cache_dir:
+            return
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+
+        try:
+            write_atomically(os.path.join(self.cache_dir, MANIFEST_NAME), write)
+        except OSError as e:
+            print(f"スライドの縮小版の記録の書き込み中にエラー: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "writes": self.writes,
+                "disk_bytes": self._disk.bytes,
+            }
+
+    # --- 内部処理 ---
+    def _name(self, slide, size, extension):
+        return f"{self.source_key(slide)}_{int(size[0])}x{int(size[1])}{extension}"
+
+    def _find(self, slide, size) -> str | None:
+        if not self.cache_dir:
+            return None
+        for extension in DERIVATIVE_EXTENSIONS:
+            path = self._disk.path(self._name(slide, size, extension))
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _read_manifest(self):
+        if not self.cache_dir:
+            return
+        try:
+            with open(os.path.join(self.cache_dir, MANIFEST_NAME), encoding="utf-8") as f:
+                data = json.load(f)
+            self._manifest["display_box"] = data.get("display_box")
+            self._manifest["sources"] = dict(data.get("sources", {}))
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"スライドの縮小版の記録を読み込めません (作り直します): {e}")
@@ -0,0 +1,103 @@
+import os
+import threading
+
+
+def write_atomically(path, write) -> int:
+    """write(一時ファイルのパス) で書いてから置き換える (書きかけのファイルを読まれない)。書いたバイト数を返す"""
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        write(tmp_path)
+        nbytes = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return nbytes
+
+
+class DiskCacheDir:
+    """1項目1ファイルで保存し、合計サイズが上限を超えたら最も長く使われていないものから消すフォルダ (最終使用時刻は更新時刻で表す)"""
+
+    def __init__(self, directory, max_bytes, extensions, label="キャッシュ"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.extensions = tuple(extensions) # この拡張子のファイルだけを項目として数える
+        self.label = label # エラーメッセージに使う名前
+        self.bytes = 0
+        self._lock = threading.Lock()
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                self.bytes = sum(size for _, size, _ in self.entries())
+            except OSError as e:
+                print(f"{self.label}フォルダ '{self.directory}' を使用できません: {e}")
+                self.directory = None
+
+    def path(self, name) -> str:
+        return os.path.join(self.directory, name)
+
+    def touch(self, path):
+        """最終使用時刻を更新する (削除順の判定に使う)"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def write(self, name, write) -> bool:
+        """write(一時ファイルのパス) で項目を書き、上限を超えたら古いものから削除する"""
+        if not self.directory:
+            return False
+        path = self.path(name)
+        try:
+            existed = os.path.exists(path)
+            nbytes = write_atomically(path, write)
+        except OSError as e:
+            print(f"{self.label}の書き込み中にエラー: {e}")
+            return False
+        with self._lock:
+            if not existed:
+                self.bytes += nbytes
+            if self.bytes > self.max_bytes:
+                self._evict()
+        return True
+
+    def remove(self, path, size) -> bool:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"{self.label}の削除中にエラー: {e}")
+            return False
+        with self._lock:
+            self.bytes -= size
+        return True
+
+    def entries(self):
+        """(パス, サイズ, 最終使用時刻) の一覧"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.extensions):
+                continue
+            path = self.path(name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        """上限に収まるまで、最も長く使われていないファイルから削除する (ロック取得済みで呼ぶ)"""
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as e:
+                print(f"{self.label}の削除中にエラー: {e}")
+        self.bytes = total
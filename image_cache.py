@@ -0,0 +1,93 @@
+from collections import OrderedDict
+
+from PIL import Image, ImageTk
+
+# --- キャッシュの既定値 ---
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024 # 表示用に保持する画像の合計サイズの上限 (64MB)
+BYTES_PER_PIXEL = 4 # Tkの画像は1画素あたりRGBAの4バイトを使う
+
+
+class ResizedImageCache:
+    """リサイズ済みのPhotoImageを (元画像, 表示サイズ, 補間方法) ごとに保持するLRUキャッシュ (Tkのスレッドからだけ使う)"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # (id(元), サイズ, 補間方法) -> (元, PhotoImage, バイト数) (末尾が最近使ったもの)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, image: Image.Image, size, resample=Image.Resampling.LANCZOS) -> ImageTk.PhotoImage:
+        """imageをsizeにリサイズしたPhotoImageを返す (同じ組み合わせは2回目からリサイズしない)"""
+        photo = self.lookup(image, size, resample)
+        if photo is None:
+            size = (int(size[0]), int(size[1]))
+            photo = self.put(image, size, image if image.size == size else image.resize(size, resample), resample)
+        return photo
+
+    def lookup(self, source, size, resample=Image.Resampling.LANCZOS) -> ImageTk.PhotoImage | None:
+        """保持済みならPhotoImageを返す (なければNone)。sourceは元画像か、スライドの項目など元を表すオブジェクト"""
+        key = (id(source), (int(size[0]), int(size[1])), resample)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] is not source: # idは解放後に再利用されるので、同じものかも確かめる
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def contains(self, source, size, resample=Image.Resampling.LANCZOS) -> bool:
+        entry = self._entries.get((id(source), (int(size[0]), int(size[1])), resample))
+        return entry is not None and entry[0] is source
+
+    def put(self, source, size, resized: Image.Image, resample=Image.Resampling.LANCZOS) -> ImageTk.PhotoImage:
+        """別の場所 (先読みスレッドなど) でリサイズ済みの画像からPhotoImageを作って保持する"""
+        self.misses += 1
+        size = (int(size[0]), int(size[1]))
+        key = (id(source), size, resample)
+        photo = ImageTk.PhotoImage(resized)
+        nbytes = size[0] * size[1] * BYTES_PER_PIXEL
+        if nbytes <= self.max_bytes: # 上限より大きい画像は保持しない
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (source, photo, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+        return photo
+
+    def preview(self, image: Image.Image, size, resample=Image.Resampling.BILINEAR,
+                quality=Image.Resampling.LANCZOS) -> ImageTk.PhotoImage:
+        """ドラッグ中などの仮表示用に、軽い補間でリサイズする (保持しない。高品質版が保持済みならそれを返す)"""
+        size = (int(size[0]), int(size[1]))
+        entry = self._entries.get((id(image), size, quality))
+        if entry is not None and entry[0] is image:
+            self.hits += 1
+            return entry[1]
+        return ImageTk.PhotoImage(image if image.size == size else image.resize(size, resample))
+
+    def invalidate(self, source):
+        """sourceから作ったものをすべて捨てる (元画像を閉じる・差し替えるとき)"""
+        for key in [key for key, entry in self._entries.items() if entry[0] is source]:
+            self._discard(key)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        """ヒット・ミス数と現在の使用量を返す"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "items": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+    def _discard(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
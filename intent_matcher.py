@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import unicodedata
+from collections import deque
+from typing import NamedTuple
+
+try:
+    import pykakasi
+except ImportError: # 漢字を読みに変換しない場合は不要
+    pykakasi = None
+
+# --- 正規化・あいまい一致の既定値 ---
+IGNORED_CHARS = set(" 　、。，．,.!?！？・…「」『』（）()〜~♪") # 一致の判定では無視する記号
+NGRAM_SIZE = 2 # あいまい検索の絞り込みに使うn-gramの長さ
+DEFAULT_FUZZY_THRESHOLD = 0.75 # あいまい一致とみなす類似度 (1 - 編集距離 / キーワード長) の下限
+DEFAULT_FUZZY_MARGIN = 0.1 # あいまい一致では、別の意図の候補よりこれ以上似ていなければ一致なしとする
+_kakasi = pykakasi.kakasi() if pykakasi is not None else None
+
+
+def normalize_text(text: str, use_reading=True) -> str:
+    """全角・半角とカタカナ・ひらがなの違い、記号や空白を吸収する (pykakasiがあれば漢字も読みにする)"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    if use_reading and _kakasi is not None:
+        text = "".join(item["hira"] for item in _kakasi.convert(text))
+    chars = []
+    for char in text:
+        if char in IGNORED_CHARS or char.isspace():
+            continue
+        if "ァ" <= char <= "ヶ": # カタカナ -> ひらがな
+            char = chr(ord(char) - 0x60)
+        chars.append(char)
+    return "".join(chars)
+
+
+def substring_edit_distance(pattern: str, text: str) -> int:
+    """textのどこかの部分文字列とpatternとの最小の編集距離 (挿入・削除・置換)"""
+    previous = list(range(len(pattern) + 1)) # textの先頭からどこで始めてもよいよう、列ごとに0から始める
+    best = previous[-1]
+    for char in text:
+        current = [0]
+        for i, pattern_char in enumerate(pattern, start=1):
+            current.append(min(previous[i] + 1, current[i - 1] + 1, previous[i - 1] + (pattern_char != char)))
+        best = min(best, current[-1])
+        previous = current
+    return best
+
+
+def ngrams(text: str, n=NGRAM_SIZE) -> list[str]:
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class AhoCorasick:
+    """複数のキーワードを、テキストを1回走査するだけで全て見つけるオートマトン"""
+
+    def __init__(self, patterns: list[str]):
+        self.patterns = list(patterns)
+        self._goto = [{}] # ノードごとの遷移 (文字 -> ノード番号)
+        self._fail = [0] # 失敗時の遷移先
+        self._output = [[]] # ノードで一致が確定するパターン番号
+
+        for index, pattern in enumerate(self.patterns):
+            if not pattern:
+                continue
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(index)
+
+        # 幅優先で失敗遷移を作り、接尾辞で一致するパターンも出力に含める
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text: str):
+        """(一致した末尾の位置, パターン番号) を順に返す"""
+        node = 0
+        for position, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            for index in self._output[node]:
+                yield position, index
+
+
+class NgramIndex:
+    """n-gramからキーワードの候補を引く索引 (編集距離を計算する相手を絞り込む)"""
+
+    def __init__(self, keywords: list[str], n=NGRAM_SIZE):
+        self.keywords = keywords
+        self.n = n
+        self._postings = {} # n-gram -> キーワード番号の集合
+        for index, keyword in enumerate(keywords):
+            for gram in set(ngrams(keyword, n)):
+                self._postings.setdefault(gram, set()).add(index)
+
+    def candidates(self, text: str, max_edits) -> list[int]:
+        """max_edits(キーワード番号)回以内の編集で一致しうるキーワードを返す"""
+        shared = {}
+        for gram in set(ngrams(text, self.n)):
+            for index in self._postings.get(gram, ()):
+                shared[index] = shared.get(index, 0) + 1
+        result = []
+        for index, count in shared.items():
+            # 編集1回で壊れるn-gramは高々n個なので、それを超えて一致が少なければ候補から外す
+            needed = len(ngrams(self.keywords[index], self.n)) - max_edits(index) * self.n
+            if count >= max(needed, 1):
+                result.append(index)
+        return result
+
+
+class Intent(NamedTuple):
+    """意図の定義 (表の先頭にあるものほど優先される)"""
+    name: str
+    keywords: tuple
+    response: str
+    action: str | None
+    priority: int
+
+
+class IntentMatch(NamedTuple):
+    """応答の決定結果 (意図が見つからなければintentはNone)"""
+    intent: Intent | None
+    response: str
+    action: str | None
+    keyword: str | None
+    confidence: float = 1.0 # あいまい一致の場合は類似度
+
+
+class IntentTable:
+    """キーワードから意図・応答・動作をまとめて引く表"""
+
+    def __init__(self, intents: list[Intent], fallback_response: str, no_input_response: str,
+                 fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD, fuzzy_margin=DEFAULT_FUZZY_MARGIN):
+        self.intents = intents
+        self.fallback_response = fallback_response # {text}はユーザーの発言に置き換える
+        self.no_input_response = no_input_response
+        self.fuzzy_threshold = fuzzy_threshold # Noneならあいまい一致を使わない
+        self.fuzzy_margin = fuzzy_margin
+        self._keywords = [] # パターン番号 -> 元のキーワード
+        self._keyword_intents = [] # パターン番号 -> 意図
+        for intent in intents:
+            for keyword in intent.keywords:
+                self._keywords.append(keyword)
+                self._keyword_intents.append(intent)
+        # 表記ゆれを吸収するため、キーワードも発言も正規化してから照合する
+        normalized = [normalize_text(keyword) for keyword in self._keywords]
+        self._automaton = AhoCorasick(normalized)
+        self._index = NgramIndex(normalized)
+
+    @classmethod
+    def load(cls, path, fuzzy_threshold=DEFAULT_FUZZY_THRESHOLD) -> "IntentTable":
+        """JSONファイルから読み込む"""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        intents = [
+            Intent(entry["name"], tuple(entry["keywords"]), entry["response"], entry.get("action"), priority)
+            for priority, entry in enumerate(data["intents"])
+        ]
+        return cls(intents, data["fallback_response"], data["no_input_response"], fuzzy_threshold)
+
+    def match(self, text: str, fuzzy=True) -> tuple[Intent, str, float] | None:
+        """最も優先度の高い意図と、そのキーワード・類似度を返す (完全一致がなければあいまい一致を探す)"""
+        normalized = normalize_text(text)
+        best = None
+        for _, index in self._automaton.find_all(normalized):
+            intent = self._keyword_intents[index]
+            if best is None or intent.priority < best[0].priority:
+                best = (intent, self._keywords[index], 1.0)
+        if best is None and fuzzy and self.fuzzy_threshold is not None:
+            best = self._fuzzy_match(normalized)
+        return best
+
+    def _fuzzy_match(self, normalized: str) -> tuple[Intent, str, float] | None:
+        """編集距離による類似度が閾値以上のキーワードのうち、最も似ているものを返す
+        (「スライドショー開始」と「スライドショー停止」のように、別の意図の候補と同じくらい似ていれば一致なしとする。
+        表の順番で決めると、言い間違いで別の動作が実行されてしまう)"""
+        patterns = self._automaton.patterns
+        max_edits = lambda index: int(len(patterns[index]) * (1 - self.fuzzy_threshold))
+        best_by_intent = {} # 意図の名前 -> (意図, キーワード, 類似度)
+        for index in self._index.candidates(normalized, max_edits):
+            if max_edits(index) == 0:
+                continue # 短いキーワードは完全一致のみ (完全一致はすでに調べた)
+            similarity = 1 - substring_edit_distance(patterns[index], normalized) / len(patterns[index])
+            if similarity < self.fuzzy_threshold:
+                continue
+            intent = self._keyword_intents[index]
+            best = best_by_intent.get(intent.name)
+            if best is None or similarity > best[2]:
+                best_by_intent[intent.name] = (intent, self._keywords[index], similarity)
+        if not best_by_intent:
+            return None
+        ranked = sorted(best_by_intent.values(), key=lambda candidate: candidate[2], reverse=True)
+        if len(ranked) > 1 and ranked[0][2] - ranked[1][2] < self.fuzzy_margin:
+            return None # どちらの意図か決められない
+        return ranked[0]
+
+    def respond(self, text: str | None) -> IntentMatch:
+        """発言に対する応答と動作を決める"""
+        if not text:
+            return IntentMatch(None, self.no_input_response, None, None)
+        found = self.match(text)
+        if found is None:
+            return IntentMatch(None, self.fallback_response.format(text=text), None, None)
+        intent, keyword, confidence = found
+        return IntentMatch(intent, intent.response, intent.action, keyword, confidence)
+
+    def keywords(self) -> list[str]:
+        return list(self._keywords)
+
+    def responses(self) -> list[str]:
+        return [intent.response for intent in self.intents]
+
+
+def main():
+    """意図の表を確かめる (キーワードは自分の意図に、"ambiguous"の発言はどの意図にも一致しないことを確認する)"""
+    parser = argparse.ArgumentParser(description="意図の表の確認")
+    parser.add_argument("texts", nargs="*", help="一致する意図を表示する発言 (省略すると intents.json の内容で確認する)")
+    parser.add_argument("--intents", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json"))
+    args = parser.parse_args()
+
+    table = IntentTable.load(args.intents)
+    if args.texts:
+        for text in args.texts:
+            found = table.match(text)
+            print(f"{found[2]:.2f} {text} -> {found[0].name}" if found else f"---- {text} -> (なし)")
+        return
+
+    with open(args.intents, encoding="utf-8") as f:
+        data = json.load(f)
+    failures = 0
+    for intent in table.intents:
+        for keyword in intent.keywords:
+            found = table.match(keyword)
+            if found is None or found[0] is not intent:
+                print(f"NG {keyword}: 自分の意図 '{intent.name}' に一致しません")
+                failures += 1
+    for text in data.get("ambiguous", []):
+        found = table.match(text)
+        if found is not None:
+            print(f"NG {found[2]:.2f} {text}: 意図 '{found[0].name}' に一致してしまいます")
+            failures += 1
+    print("OK" if failures == 0 else f"{failures}件の問題があります")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# VOICEVOXエンジンの代わりに使うローカルサーバー (ベンチマーク・CI用)
+# 実際の音声合成は行わず、テキストから決まる合成音 (正弦波) を返す。
+# 使い方: python mock_voicevox_engine.py --port 50021 --query-latency 0.05 --synthesis-latency 0.2
+import argparse
+import array
+import hashlib
+import io
+import json
+import math
+import threading
+import time
+import wave
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ENGINE_VERSION = "0.0.0-mock"
+PUNCTUATION = "、。！？!?…,，.「」『』 \n"
+MORA_LENGTH = 0.12 # 1文字あたりの長さ (秒)
+
+
+def build_audio_query(text: str, speaker: int) -> dict:
+    """VOICEVOXと同じ形のaudio_queryを作る (1文字を1モーラとして扱う)"""
+    seed = int(hashlib.sha256(f"{speaker}:{text}".encode("utf-8")).hexdigest()[:8], 16)
+    moras = []
+    for i, char in enumerate(ch for ch in text if ch not in PUNCTUATION):
+        moras.append({
+            "text": char,
+            "consonant": None,
+            "consonant_length": None,
+            "vowel": "a",
+            "vowel_length": MORA_LENGTH,
+            "pitch": 5.0 + ((seed >> (i % 24)) & 7) * 0.1,
+        })
+    return {
+        "accent_phrases": [{"moras": moras, "accent": 1, "pause_mora": None, "is_interrogative": text.endswith(("？", "?"))}],
+        "speedScale": 1.0,
+        "pitchScale": 0.0,
+        "intonationScale": 1.0,
+        "volumeScale": 1.0,
+        "prePhonemeLength": 0.1,
+        "postPhonemeLength": 0.1,
+        "outputSamplingRate": 24000,
+        "outputStereo": False,
+        "kana": text,
+    }
+
+
+def synthesize(query: dict) -> bytes:
+    """クエリの長さ・話速・音高・音量を反映した正弦波のWAVを作る (同じクエリなら同じ出力)"""
+    sample_rate = int(query.get("outputSamplingRate", 24000))
+    speed = float(query.get("speedScale", 1.0)) or 1.0
+    volume = float(query.get("volumeScale", 1.0))
+    pitch_shift = 2 ** float(query.get("pitchScale", 0.0))
+    channels = 2 if query.get("outputStereo") else 1
+
+    samples = array.array("h")
+
+    def silence(seconds):
+        samples.extend([0] * (int(seconds * sample_rate) * channels))
+
+    silence(float(query.get("prePhonemeLength", 0.1)))
+    for phrase in query.get("accent_phrases", []):
+        for mora in phrase.get("moras", []):
+            length = ((mora.get("consonant_length") or 0.0) + (mora.get("vowel_length") or 0.0)) / speed
+            frequency = 40.0 * float(mora.get("pitch") or 5.0) * pitch_shift
+            amplitude = 8000 * volume
+            for n in range(int(length * sample_rate)):
+                value = int(amplitude * math.sin(2 * math.pi * frequency * n / sample_rate))
+                samples.extend([value] * channels)
+    silence(float(query.get("postPhonemeLength", 0.1)))
+    return _to_wav(samples.tobytes(), sample_rate, channels)
+
+
+def _to_wav(pcm: bytes, sample_rate: int, channels: int) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class MockEngineHandler(BaseHTTPRequestHandler):
+    """エンドポイントごとの処理 (遅延はサーバーの設定値を使う)"""
+    protocol_version = "HTTP/1.1" # キープアライブ接続を受け付ける
+    disable_nagle_algorithm = True # ヘッダーと本文の分割送信で遅延ACK待ちが起きないようにする
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status, body: bytes, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, data, status=200):
+        self._send(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def _read_body(self) -> bytes:
+        """本文を読み切る (キープアライブ接続で読み残すと、残りが次のリクエストとして解釈されてしまう)"""
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length > 0 else b""
+
+    @staticmethod
+    def _parse_json(body: bytes):
+        return json.loads(body or b"null")
+
+    def _delay(self, seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/version":
+            self._send_json(ENGINE_VERSION)
+        else:
+            self._send_json({"detail": "Not Found"}, 404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        self.server.count_request(url.path)
+        body = self._read_body() # 404などのエラーを返す場合も先に読んでおく
+        try:
+            if url.path == "/audio_query":
+                text = params.get("text", [""])[0]
+                self._delay(self.server.query_latency + self.server.per_char_latency * len(text))
+                self._send_json(build_audio_query(text, int(params.get("speaker", ["0"])[0])))
+            elif url.path == "/synthesis":
+                query = self._parse_json(body)
+                self._delay(self.server.synthesis_latency)
+                self._send(200, synthesize(query), "audio/wav")
+            elif url.path == "/multi_synthesis" and self.server.enable_batch:
+                queries = self._parse_json(body)
+                self._delay(self.server.synthesis_latency)
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, "w") as zf:
+                    for i, query in enumerate(queries, start=1):
+                        zf.writestr(f"{i:03}.wav", synthesize(query))
+                self._send(200, archive.getvalue(), "application/zip")
+            else:
+                self._send_json({"detail": "Not Found"}, 404)
+        except (ValueError, KeyError, TypeError, wave.Error) as e:
+            self._send_json({"detail": str(e)}, 422)
+
+
+class MockEngineServer(ThreadingHTTPServer):
+    """遅延や一括合成の有無を設定できるVOICEVOX代替サーバー"""
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=50021, query_latency=0.0, synthesis_latency=0.0,
+                 per_char_latency=0.0, enable_batch=True, verbose=False):
+        super().__init__((host, port), MockEngineHandler)
+        self.query_latency = query_latency
+        self.synthesis_latency = synthesis_latency
+        self.per_char_latency = per_char_latency
+        self.enable_batch = enable_batch
+        self.verbose = verbose
+        self.request_counts = {} # エンドポイントごとの受信数 (ベンチマークの確認用)
+        self._counts_lock = threading.Lock()
+
+    def count_request(self, path):
+        with self._counts_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+
+def start_mock_engine(host="127.0.0.1", port=50021, **options) -> MockEngineServer:
+    """バックグラウンドのスレッドでサーバーを起動する (port=0なら空いているポートを使う)"""
+    server = MockEngineServer(host, port, **options)
+    threading.Thread(target=server.serve_forever, name="mock-voicevox", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VOICEVOXエンジンの代替サーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=50021)
+    parser.add_argument("--query-latency", type=float, default=0.0, help="/audio_queryの遅延 (秒)")
+    parser.add_argument("--per-char-latency", type=float, default=0.0, help="/audio_queryの1文字あたりの追加遅延 (秒)")
+    parser.add_argument("--synthesis-latency", type=float, default=0.0, help="/synthesisの遅延 (秒)")
+    parser.add_argument("--no-batch", action="store_true", help="/multi_synthesisを無効にする")
+    parser.add_argument("--verbose", action="store_true", help="リクエストのログを表示する")
+    args = parser.parse_args()
+
+    server = MockEngineServer(
+        args.host, args.port,
+        query_latency=args.query_latency,
+        synthesis_latency=args.synthesis_latency,
+        per_char_latency=args.per_char_latency,
+        enable_batch=not args.no_batch,
+        verbose=args.verbose
+    )
+    print(f"VOICEVOX代替サーバーを起動しました: http://{args.host}:{args.port} (Ctrl+Cで終了)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n代替サーバーを終了します。")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# --- ノイズ追跡の既定値 ---
+DEFAULT_RECALIBRATION_INTERVAL = 30.0 # 再調整の間隔 (秒)
+DEFAULT_SAMPLE_DURATION = 0.5 # 1回の調整で聞く長さ (秒)
+DEFAULT_PERCENTILE = 20 # 話し声などの突発音を除くため、ブロックごとの音量の下位この割合をノイズとみなす
+MIN_ENERGY_THRESHOLD = 50 # 静かな部屋でも閾値がこれより下がらないようにする
+
+
+def block_energies(pcm, sample_width=2, block_frames=1024) -> np.ndarray:
+    """PCMをブロックに分け、各ブロックのRMS (speech_recognitionのenergyと同じ尺度) を返す"""
+    if isinstance(pcm, np.ndarray):
+        samples = pcm.reshape(-1)
+    else:
+        dtype = {1: np.int8, 2: np.int16, 4: np.int32}[sample_width]
+        samples = np.frombuffer(pcm, dtype=dtype)
+    blocks = len(samples) // block_frames
+    if blocks == 0:
+        return np.sqrt(np.mean(np.square(samples, dtype=np.float64), keepdims=True)) if len(samples) else np.empty(0)
+    shaped = samples[:blocks * block_frames].reshape(blocks, block_frames).astype(np.float64)
+    return np.sqrt(np.mean(np.square(shaped), axis=1))
+
+
+class NoiseFloorTracker:
+    """待機中のマイク音から環境ノイズを推定し、recognizer.energy_thresholdを更新し続ける"""
+
+    def __init__(self, recognizer, microphone=None, recalibration_interval=DEFAULT_RECALIBRATION_INTERVAL,
+                 sample_duration=DEFAULT_SAMPLE_DURATION, percentile=DEFAULT_PERCENTILE):
+        self.recognizer = recognizer
+        self.microphone = microphone
+        self.recalibration_interval = recalibration_interval
+        self.sample_duration = sample_duration
+        self.percentile = percentile
+        self.noise_floor = None # 直近に推定したノイズの大きさ
+        self.last_calibrated = None # 最後に調整したtime.monotonic()の値
+
+        self._mic_lock = threading.Lock() # マイクを開けるのは聞き取りか調整のどちらか一方だけ
+        self._listen_requested = threading.Event() # 聞き取りが待っていれば調整を途中でやめる
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def is_calibrated(self) -> bool:
+        return self.last_calibrated is not None
+
+    def observe(self, pcm, sample_rate, sample_width=2) -> float | None:
+        """発話を含まない音声を渡して閾値を更新する (推定したノイズの大きさを返す)"""
+        energies = block_energies(pcm, sample_width)
+        if len(energies) == 0:
+            return None
+        noise_floor = float(np.percentile(energies, self.percentile))
+        seconds = (len(pcm) if isinstance(pcm, np.ndarray) else len(pcm) // sample_width) / sample_rate
+
+        # adjust_for_ambient_noiseと同じ減衰率で、聞いた時間に応じて目標値へ近づける
+        damping = self.recognizer.dynamic_energy_adjustment_damping ** seconds
+        target = noise_floor * self.recognizer.dynamic_energy_ratio
+        threshold = self.recognizer.energy_threshold * damping + target * (1 - damping)
+        self.recognizer.energy_threshold = max(threshold, MIN_ENERGY_THRESHOLD)
+        self.noise_floor = noise_floor
+        self.last_calibrated = time.monotonic()
+        return noise_floor
+
+    @contextmanager
+    def listening(self):
+        """聞き取りの間は調整を止める (調整中ならすぐに切り上げさせる)"""
+        self._listen_requested.set()
+        with self._mic_lock:
+            self._listen_requested.clear()
+            yield
+
+    # --- バックグラウンドでの定期調整 ---
+    def start(self):
+        """起動直後に1回、その後はrecalibration_intervalごとに調整するスレッドを開始する"""
+        if self.microphone is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="noise-floor", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        self._listen_requested.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self.calibrate()
+            self._stop_event.wait(self.recalibration_interval)
+
+    def calibrate(self) -> bool:
+        """マイクが空いていれば短時間だけ開いて調整する (聞き取り中なら何もしない)"""
+        if self._listen_requested.is_set() or not self._mic_lock.acquire(blocking=False):
+            return False
+        try:
+            with self.microphone as source:
+                chunks = []
+                needed = int(source.SAMPLE_RATE * self.sample_duration / source.CHUNK)
+                while len(chunks) < needed and not self._listen_requested.is_set():
+                    chunks.append(source.stream.read(source.CHUNK))
+            if chunks:
+                self.observe(b"".join(chunks), source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            return bool(chunks)
+        except Exception as e:
+            print(f"ノイズレベルの調整中にエラー: {e}")
+            return False
+        finally:
+            self._mic_lock.release()
@@ -0,0 +1,239 @@
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import tkinter as tk
+from tkinter import ttk
+
+# --- トレースの既定値 ---
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024 # JSONLファイル1つあたりの上限
+DEFAULT_BACKUP_COUNT = 3 # ローテーションで残す古いファイルの数
+DEFAULT_WINDOW = 200 # パーセンタイル計算に使う直近の計測数
+DEFAULT_SUMMARY_INTERVAL = 60 # 集計値をファイルに書き出す間隔 (秒)
+
+_current_span = contextvars.ContextVar("perf_trace_span", default=None) # 親スパン名 (スレッド・タスクごと)
+
+
+class _SpanStats:
+    """1種類のスパンの集計 (回数・合計・最大と直近の所要時間)"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.recent.append(seconds)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent)
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": recent[len(recent) // 2] * 1000 if recent else 0.0,
+            "p95_ms": recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000 if recent else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class Tracer:
+    """モノトニック時計によるスパン計測とカウンター (結果はローテーションするJSONLファイルへ)"""
+
+    def __init__(self, log_path=None, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT,
+                 window=DEFAULT_WINDOW, summary_interval=DEFAULT_SUMMARY_INTERVAL, enabled=True):
+        self.enabled = enabled
+        self.window = window
+        self.summary_interval = summary_interval
+        self._lock = threading.Lock()
+        self._spans = {}
+        self._counters = {}
+        self._last_summary = time.monotonic()
+
+        # ファイルへの書き込みは別スレッドで行い、計測側では待たない
+        self._listener = None
+        self._logger = None
+        if log_path is not None:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+                handler = logging.handlers.RotatingFileHandler(
+                    log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+                )
+            except OSError as e:
+                print(f"トレースファイルを開けません ({log_path}): {e}")
+            else:
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                records = queue.SimpleQueue()
+                self._logger = logging.getLogger(f"perf_trace.{id(self)}")
+                self._logger.setLevel(logging.INFO)
+                self._logger.propagate = False
+                self._logger.addHandler(logging.handlers.QueueHandler(records))
+                self._listener = logging.handlers.QueueListener(records, handler)
+                self._listener.start()
+
+    # --- 計測 ---
+    @contextmanager
+    def span(self, name, log_threshold_ms=0.0, **attrs):
+        """withブロックの所要時間を計測する (log_threshold_ms未満のスパンは集計のみでファイルには書かない)"""
+        if not self.enabled:
+            yield
+            return
+        parent = _current_span.get()
+        token = _current_span.set(name)
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            seconds = time.monotonic() - started
+            self._add(name, seconds)
+            if seconds * 1000 >= log_threshold_ms:
+                record = {"type": "span", "name": name, "start": started, "dur_ms": round(seconds * 1000, 3),
+                          "thread": threading.current_thread().name}
+                if parent is not None:
+                    record["parent"] = parent
+                if error is not None:
+                    record["error"] = error
+                if attrs:
+                    record["attrs"] = attrs
+                self._write(record)
+
+    def traced(self, name=None, log_threshold_ms=0.0):
+        """関数全体をスパンとして計測するデコレーター (async関数にも使える)"""
+        def decorator(func):
+            span_name = name or func.__name__
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(span_name, log_threshold_ms):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name, log_threshold_ms):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds, **attrs):
+        """別の方法で測った所要時間を記録する (最初の音までの時間など)"""
+        if not self.enabled:
+            return
+        self._add(name, seconds)
+        record = {"type": "span", "name": name, "start": time.monotonic() - seconds, "dur_ms": round(seconds * 1000, 3)}
+        if attrs:
+            record["attrs"] = attrs
+        self._write(record)
+
+    def count(self, name, n=1):
+        """カウンターを増やす (集計値としてまとめて書き出す)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    # --- 集計 ---
+    def snapshot(self) -> dict:
+        """スパンごとの集計値とカウンターを返す"""
+        with self._lock:
+            return {
+                "spans": {name: stats.summary() for name, stats in self._spans.items()},
+                "counters": dict(self._counters),
+            }
+
+    def close(self):
+        """最後の集計値を書き出してファイルを閉じる"""
+        if self._listener is None:
+            return
+        self._write_summary()
+        self._listener.stop()
+        for handler in self._listener.handlers:
+            handler.close()
+        self._listener = None
+        self._logger = None
+
+    # --- 内部処理 ---
+    def _add(self, name, seconds):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats(self.window)
+            stats.add(seconds)
+            now = time.monotonic()
+            due = now - self._last_summary >= self.summary_interval
+            if due:
+                self._last_summary = now
+        if due:
+            self._write_summary()
+
+    def _write_summary(self):
+        self._write({"type": "summary", "time": time.time(), "mono": time.monotonic(), **self.snapshot()})
+
+    def _write(self, record):
+        if self._logger is not None:
+            self._logger.info(json.dumps(record, ensure_ascii=False))
+
+
+class StatsPanel:
+    """トレースの集計値を表示する別ウィンドウ (定期的に自動更新する)"""
+
+    def __init__(self, master, tracer: Tracer, refresh_ms=1000):
+        self.tracer = tracer
+        self.refresh_ms = refresh_ms
+        self.window = tk.Toplevel(master)
+        self.window.title("処理時間の統計")
+        self.window.geometry("560x360")
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+
+        columns = ("count", "p50", "p95", "max", "mean")
+        self.tree = ttk.Treeview(self.window, columns=columns, height=10)
+        self.tree.heading("#0", text="スパン")
+        self.tree.column("#0", width=220)
+        for column, label in zip(columns, ("回数", "p50 (ms)", "p95 (ms)", "最大 (ms)", "平均 (ms)")):
+            self.tree.heading(column, text=label)
+            self.tree.column(column, width=64, anchor=tk.E)
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+
+        self.counter_label = ttk.Label(self.window, justify=tk.LEFT)
+        self.counter_label.pack(fill=tk.X, padx=5, pady=5)
+
+        self.after_id = None
+        self.refresh()
+
+    def refresh(self):
+        snapshot = self.tracer.snapshot()
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in sorted(snapshot["spans"].items()):
+            self.tree.insert("", tk.END, text=name, values=(
+                stats["count"], f"{stats['p50_ms']:.1f}", f"{stats['p95_ms']:.1f}",
+                f"{stats['max_ms']:.1f}", f"{stats['mean_ms']:.1f}"
+            ))
+        counters = "  ".join(f"{name}: {value}" for name, value in sorted(snapshot["counters"].items()))
+        self.counter_label.config(text=f"カウンター: {counters or 'なし'}")
+        self.after_id = self.window.after(self.refresh_ms, self.refresh)
+
+    def is_open(self) -> bool:
+        return self.window.winfo_exists()
+
+    def close(self):
+        if self.after_id:
+            self.window.after_cancel(self.after_id)
+            self.after_id = None
+        self.window.destroy()
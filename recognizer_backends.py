@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+
+import speech_recognition as sr
+
+try:
+    import vosk
+except ImportError: # オフライン認識を使わない場合は不要
+    vosk = None
+
+# --- 認識バックエンドの既定値 ---
+DEFAULT_LANGUAGE = "ja-JP"
+VOSK_SAMPLE_RATE = 16000 # Voskの日本語モデルが想定するサンプリングレート
+
+
+class RecognizerBackend:
+    """音声認識バックエンドの共通インターフェース"""
+    name = "base"
+    supports_streaming = False # start_streamで話している途中の認識結果を返せるか
+
+    def load(self):
+        """モデルの読み込みなどの準備をする (何度呼んでもよい)"""
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        """音声をテキストにする (認識できなければsr.UnknownValueError、使えなければsr.RequestError)"""
+        raise NotImplementedError
+
+    def start_stream(self, sample_rate, sample_width=2):
+        """逐次認識を開始する (feed(pcm)で途中結果、finish()で最終結果を返すオブジェクト)"""
+        raise NotImplementedError
+
+    def close(self):
+        """モデルなどを解放する"""
+
+
+class GoogleBackend(RecognizerBackend):
+    """Google Web Speech APIによる認識 (インターネット接続が必要)"""
+    name = "google"
+
+    def __init__(self, language=DEFAULT_LANGUAGE):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        return self.recognizer.recognize_google(audio, language=self.language)
+
+
+class VoskBackend(RecognizerBackend):
+    """Voskによるオフライン認識 (モデルは一度だけ読み込んで保持する)"""
+    name = "vosk"
+    supports_streaming = True
+
+    def __init__(self, model_path, sample_rate=VOSK_SAMPLE_RATE):
+        self.model_path = model_path
+        self.sample_rate = sample_rate
+        self.model = None
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        with self._load_lock:
+            if self.model is not None:
+                return
+            if vosk is None:
+                raise sr.RequestError("voskがインストールされていません (pip install vosk)")
+            if not os.path.isdir(self.model_path):
+                raise sr.RequestError(f"Voskのモデルが見つかりません: {self.model_path}")
+            vosk.SetLogLevel(-1)
+            self.model = vosk.Model(self.model_path)
+
+    def transcribe(self, audio: sr.AudioData) -> str:
+        self.load()
+        recognizer = vosk.KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(audio.get_raw_data(convert_rate=self.sample_rate, convert_width=2))
+        text = json.loads(recognizer.FinalResult()).get("text", "")
+        text = text.replace(" ", "") # 日本語モデルは単語を空白で区切って返す
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def start_stream(self, sample_rate, sample_width=2):
+        if sample_width != 2:
+            raise sr.RequestError("Voskの逐次認識は16bitの音声にだけ対応しています")
+        self.load()
+        return VoskStream(self.model, sample_rate)
+
+    def close(self):
+        self.model = None
+
+
+class VoskStream:
+    """Voskの逐次認識 (音声を渡すたびに、確定した部分と途中結果をつなげて返す)"""
+
+    def __init__(self, model, sample_rate):
+        self.recognizer = vosk.KaldiRecognizer(model, sample_rate) # モデルと異なるレートはVosk側で変換される
+        self.segments = []
+
+    def feed(self, pcm: bytes) -> str:
+        partial = ""
+        if pcm:
+            if self.recognizer.AcceptWaveform(pcm): # 区切りまで確定した
+                self.segments.append(json.loads(self.recognizer.Result()).get("text", ""))
+            else:
+                partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return "".join(self.segments + [partial]).replace(" ", "")
+
+    def finish(self) -> str:
+        self.segments.append(json.loads(self.recognizer.FinalResult()).get("text", ""))
+        text = "".join(self.segments).replace(" ", "")
+        if not text:
+            raise sr.UnknownValueError()
+        return text
+
+    def close(self):
+        """認識器を解放する (finishせずに打ち切るときも呼ぶ)"""
+        self.recognizer = None
+
+
+def create_backend(name, language=DEFAULT_LANGUAGE, model_path=None) -> RecognizerBackend:
+    """設定名からバックエンドを作る (オフライン認識が使えない場合はGoogleに切り替える)"""
+    if name == "vosk":
+        if vosk is None:
+            print("voskがインストールされていないため、Google音声認識を使用します。")
+        elif model_path is None or not os.path.isdir(model_path):
+            print(f"Voskのモデルが見つからないため、Google音声認識を使用します: {model_path}")
+        else:
+            return VoskBackend(model_path)
+    elif name != "google":
+        print(f"未対応の音声認識バックエンド '{name}' です。Google音声認識を使用します。")
+    return GoogleBackend(language)
@@ -0,0 +1,61 @@
+# --- リサイズ処理の既定値 ---
+DEFAULT_FRAME_MS = 16 # ドラッグ中の再配置は、この間隔に1回までにまとめる (約60fps)
+DEFAULT_SETTLE_MS = 150 # サイズ変更がこの時間止まったら、高品質で描き直す
+
+
+class ResizeScheduler:
+    """ウィンドウの<Configure>イベントをまとめ、ドラッグ中は軽い再配置、止まったら高品質の再配置を1回だけ行う"""
+
+    def __init__(self, window, on_preview, on_settle, frame_ms=DEFAULT_FRAME_MS, settle_ms=DEFAULT_SETTLE_MS):
+        self.window = window
+        self.on_preview = on_preview # on_preview(width, height): ドラッグ中の軽い再配置
+        self.on_settle = on_settle # on_settle(width, height): サイズが落ち着いた後の高品質な再配置
+        self.frame_ms = frame_ms
+        self.settle_ms = settle_ms
+        self.pending_size = None # まだ反映していない最新のサイズ
+        self.applied_size = None # 最後に高品質で反映したサイズ
+        self.previews = 0
+        self.settles = 0
+        self._frame_id = None
+        self._settle_id = None
+
+    def on_configure(self, event):
+        """<Configure>のハンドラー (子ウィジェットの分や、移動だけでサイズが変わらないものは無視する)"""
+        if event.widget is not self.window:
+            return
+        size = (event.width, event.height)
+        if size == (self.pending_size or self.applied_size):
+            return
+        self.pending_size = size
+        if self._frame_id is None:
+            self._frame_id = self.window.after(self.frame_ms, self._flush_preview)
+        if self._settle_id is not None:
+            self.window.after_cancel(self._settle_id)
+        self._settle_id = self.window.after(self.settle_ms, self._settle)
+
+    def cancel(self):
+        """予約済みの再配置を取り消す"""
+        for after_id in (self._frame_id, self._settle_id):
+            if after_id is not None:
+                self.window.after_cancel(after_id)
+        self._frame_id = None
+        self._settle_id = None
+        self.pending_size = None
+
+    def _flush_preview(self):
+        self._frame_id = None
+        if self.pending_size is not None and self._settle_id is not None:
+            self.previews += 1
+            self.on_preview(*self.pending_size)
+
+    def _settle(self):
+        self._settle_id = None
+        if self._frame_id is not None:
+            self.window.after_cancel(self._frame_id)
+            self._frame_id = None
+        size = self.pending_size
+        self.pending_size = None
+        if size is not None:
+            self.applied_size = size
+            self.settles += 1
+            self.on_settle(*size)
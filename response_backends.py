@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import time
+
+import aiohttp
+
+from intent_matcher import IntentTable, ngrams, normalize_text
+
+# --- 応答バックエンドの既定値 ---
+DEFAULT_FIRST_TOKEN_TIMEOUT = 2.0 # 最初の文字が届くまでの期限 (秒)
+DEFAULT_DEADLINE = 8.0 # 応答全体の期限 (秒)。超えたらそこで打ち切る
+DEFAULT_RETRIEVAL_MIN_SCORE = 0.6 # 検索結果を応答に使う類似度の下限
+DEFAULT_SYSTEM_PROMPT = "あなたは音声で会話するアシスタントです。日本語で、2文以内の短い話し言葉で答えてください。"
+
+
+class ResponseBackend:
+    """応答生成バックエンドの共通インターフェース (答えられなければNoneを返す)"""
+    name = "base"
+    first_token_timeout = DEFAULT_FIRST_TOKEN_TIMEOUT
+    deadline = DEFAULT_DEADLINE
+
+    async def generate(self, user_text: str) -> str | None:
+        raise NotImplementedError
+
+    async def stream(self, user_text: str):
+        """応答を少しずつ返す (既定ではgenerateの結果をまとめて1回で返す)"""
+        text = await self.generate(user_text)
+        if text:
+            yield text
+
+    async def close(self):
+        """接続などを解放する"""
+
+
+class RuleBackend(ResponseBackend):
+    """意図の表による応答 (必ず答えるので、最後の受け皿にする)"""
+    name = "rules"
+
+    def __init__(self, intent_table: IntentTable):
+        self.intent_table = intent_table
+
+    async def generate(self, user_text: str) -> str | None:
+        return self.intent_table.respond(user_text).response
+
+
+class RetrievalBackend(ResponseBackend):
+    """よくある質問と答えの一覧から、発言に最も近い質問の答えを返す (文字bigramのTF-IDF)"""
+    name = "retrieval"
+    first_token_timeout = 0.5
+    deadline = 0.5
+
+    def __init__(self, path, min_score=DEFAULT_RETRIEVAL_MIN_SCORE):
+        self.min_score = min_score
+        self.answers = []
+        self._vectors = []
+        self._idf = {}
+        self._unknown_idf = 1.0 # 一覧にないbigramの重み (どの質問にも出てこない = 最もまれなものとして扱う)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"応答検索用のデータを読み込めません ({path}): {e}")
+            return
+
+        documents = []
+        for entry in entries:
+            for question in entry["questions"]:
+                documents.append(self._grams(question))
+                self.answers.append(entry["answer"])
+        document_frequency = {}
+        for grams in documents:
+            for gram in set(grams):
+                document_frequency[gram] = document_frequency.get(gram, 0) + 1
+        self._idf = {gram: math.log((len(documents) + 1) / (count + 1)) + 1 for gram, count in document_frequency.items()}
+        self._unknown_idf = math.log(len(documents) + 1) + 1 # 出現数0として計算した値 (= idfの最大値)
+        self._vectors = [self._vectorize(grams) for grams in documents]
+
+    @staticmethod
+    def _grams(text):
+        normalized = normalize_text(text)
+        return ngrams(normalized) or [normalized]
+
+    def _vectorize(self, grams) -> dict:
+        """TF-IDFの単位ベクトル (一覧にないbigramも長さに含め、関係のない発言が偶然の一致で高い類似度にならないようにする)"""
+        vector = {}
+        for gram in grams:
+            vector[gram] = vector.get(gram, 0.0) + self._idf.get(gram, self._unknown_idf)
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {gram: value / norm for gram, value in vector.items()} if norm else {}
+
+    def search(self, user_text: str) -> tuple[str, float] | None:
+        """最も似ている質問の答えと類似度を返す"""
+        query = self._vectorize(self._grams(user_text))
+        best = None
+        for answer, vector in zip(self.answers, self._vectors):
+            score = sum(value * vector.get(gram, 0.0) for gram, value in query.items())
+            if best is None or score > best[1]:
+                best = (answer, score)
+        return best
+
+    async def generate(self, user_text: str) -> str | None:
+        best = self.search(user_text)
+        if best is None or best[1] < self.min_score:
+            return None
+        return best[0]
+
+
+class LlamaServerBackend(ResponseBackend):
+    """ローカルのLLMサーバー (llama.cppのserverなど、OpenAI互換API) の出力を逐次受け取る"""
+    name = "llm"
+
+    def __init__(self, host="127.0.0.1", port=8080, model="local", system_prompt=DEFAULT_SYSTEM_PROMPT,
+                 max_tokens=120, temperature=0.7, first_token_timeout=DEFAULT_FIRST_TOKEN_TIMEOUT,
+                 deadline=DEFAULT_DEADLINE):
+        self.url = f"http://{host}:{port}/v1/chat/completions"
+        self.model = model
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.first_token_timeout = first_token_timeout
+        self.deadline = deadline
+        self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=2, keepalive_timeout=60))
+        return self._session
+
+    async def stream(self, user_text: str):
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": user_text},
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": True,
+        }
+        timeout = aiohttp.ClientTimeout(total=self.deadline)
+        async with self._get_session().post(self.url, json=payload, timeout=timeout) as res:
+            res.raise_for_status()
+            async for line in res.content: # Server-Sent Events: "data: {...}" の行が続く
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                choices = json.loads(data).get("choices") or [{}]
+                content = choices[0].get("delta", {}).get("content")
+                if content:
+                    yield content
+
+    async def generate(self, user_text: str) -> str | None:
+        return "".join([piece async for piece in self.stream(user_text)]) or None
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class ResponseRouter:
+    """バックエンドを順に試し、期限内に答え始めたものの出力を流す (どれもだめならルールで答える)"""
+
+    def __init__(self, backends: list[ResponseBackend], fallback: RuleBackend):
+        self.backends = backends
+        self.fallback = fallback
+
+    async def stream(self, user_text: str, on_backend=None):
+        """応答を少しずつ返す。on_backend(name)は答えるバックエンドが決まったときに呼ばれる"""
+        for backend in self.backends:
+            started = time.monotonic()
+            pieces = backend.stream(user_text)
+            try:
+                first = await asyncio.wait_for(anext(pieces), backend.first_token_timeout)
+            except StopAsyncIteration:
+                continue # このバックエンドでは答えられない
+            except asyncio.TimeoutError:
+                print(f"応答バックエンド '{backend.name}' が{backend.first_token_timeout}秒以内に応答しませんでした。")
+                await pieces.aclose()
+                continue
+            except (aiohttp.ClientError, ValueError, OSError) as e:
+                print(f"応答バックエンド '{backend.name}' でエラー: {e}")
+                await pieces.aclose()
+                continue
+
+            if on_backend is not None:
+                on_backend(backend.name)
+            yield first
+            try:
+                while True:
+                    remaining = backend.deadline - (time.monotonic() - started)
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError
+                    yield await asyncio.wait_for(anext(pieces), remaining)
+            except StopAsyncIteration:
+                pass
+            except asyncio.TimeoutError:
+                print(f"応答バックエンド '{backend.name}' の応答が{backend.deadline}秒を超えたため打ち切りました。")
+            except (aiohttp.ClientError, ValueError, OSError) as e:
+                print(f"応答バックエンド '{backend.name}' の受信中にエラー: {e}")
+            finally:
+                await pieces.aclose()
+            return
+
+        if on_backend is not None:
+            on_backend(self.fallback.name)
+        text = await self.fallback.generate(user_text)
+        if text:
+            yield text
+
+    async def close(self):
+        for backend in self.backends:
+            await backend.close()
+
+
+def create_router(names, intent_table: IntentTable, faq_path=None, retrieval_min_score=DEFAULT_RETRIEVAL_MIN_SCORE,
+                  llm_options=None) -> ResponseRouter:
+    """設定名の順にバックエンドを並べたルーターを作る (意図の表による応答は常に最後の受け皿になる)"""
+    backends = []
+    for name in names:
+        if name == "retrieval":
+            if faq_path is not None and os.path.exists(faq_path):
+                backends.append(RetrievalBackend(faq_path, retrieval_min_score))
+            else:
+                print(f"応答検索用のデータが見つからないため、検索による応答は使いません: {faq_path}")
+        elif name == "llm":
+            backends.append(LlamaServerBackend(**(llm_options or {})))
+        elif name != "rules":
+            print(f"未対応の応答バックエンド '{name}' です。")
+    return ResponseRouter(backends, RuleBackend(intent_table))
+
+
+def main():
+    """よくある質問の検索を確かめる (質問は自分の答えに、"unrelated"の発言は次のバックエンドに回ることを確認する)"""
+    parser = argparse.ArgumentParser(description="よくある質問の検索の確認")
+    parser.add_argument("questions", nargs="*", help="類似度を表示する発言 (省略すると faq.json の内容で確認する)")
+    parser.add_argument("--faq", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq.json"))
+    parser.add_argument("--min-score", type=float, default=DEFAULT_RETRIEVAL_MIN_SCORE)
+    args = parser.parse_args()
+
+    backend = RetrievalBackend(args.faq, args.min_score)
+    if args.questions:
+        for question in args.questions:
+            best = backend.search(question)
+            print(f"{best[1]:.3f} {question} -> {best[0]}" if best else f"----- {question} -> (なし)")
+        return
+
+    with open(args.faq, encoding="utf-8") as f:
+        data = json.load(f)
+    failures = 0
+    for entry in data["entries"]:
+        for question in entry["questions"]:
+            answer, score = backend.search(question)
+            if answer != entry["answer"] or score < backend.min_score:
+                print(f"NG {score:.3f} {question}: 自分の答えが選ばれません")
+                failures += 1
+    for question in data.get("unrelated", []):
+        answer, score = backend.search(question)
+        if score >= backend.min_score:
+            print(f"NG {score:.3f} {question}: 関係のない発言に「{answer}」と答えてしまいます")
+            failures += 1
+    print("OK" if failures == 0 else f"{failures}件の問題があります (min_scoreか faq.json を見直してください)")
+    raise SystemExit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PIL import Image
+
+# --- スライド先読みの既定値 ---
+DEFAULT_PREFETCH_AHEAD = 2 # 表示中の次から何枚先まで先読みするか
+DEFAULT_PREFETCH_ITEMS = 6 # 保持する先読み結果の上限 (超えたら古いものから捨てる)
+
+
+class SlideEntry:
+    """スライド1枚分の情報 (起動時はパスとファイルの情報だけを持ち、画像の大きさは初めて使うときに読む)"""
+    __slots__ = ("path", "mtime_ns", "file_size", "image_size")
+
+    def __init__(self, path, mtime_ns, file_size):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.file_size = file_size
+        self.image_size = None # (幅, 高さ)
+
+
+class SlideCatalogue:
+    """スライドのパスとメタデータの一覧 (画像そのものは保持せず、表示するときに開いてデコードする)"""
+
+    def __init__(self, paths):
+        self.entries = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+            except OSError as e:
+                print(f"スライドショー画像 '{path}' を確認できません: {e}")
+                continue
+            self.entries.append(SlideEntry(path, st.st_mtime_ns, st.st_size))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, index) -> SlideEntry:
+        return self.entries[index]
+
+    def image_size(self, index) -> tuple[int, int]:
+        """画像の大きさを返す (ヘッダーだけを読み、画素はデコードしない)"""
+        entry = self.entries[index]
+        if entry.image_size is None:
+            with Image.open(entry.path) as image:
+                entry.image_size = image.size
+        return entry.image_size
+
+    def decode(self, index, size, resample=Image.Resampling.LANCZOS) -> Image.Image:
+        """画像をデコードしてsizeに縮小する (JPEGは表示サイズに近い縮小率でデコードして手間を減らす)"""
+        entry = self.entries[index]
+        with Image.open(entry.path) as image:
+            entry.image_size = image.size
+            if image.format == "JPEG":
+                image.draft(None, size) # 1/2・1/4・1/8のうち、sizeを下回らない最小の縮小率でデコードする
+            return image.resize(size, resample)
+
+
+def fit_size(image_size, box) -> tuple[int, int]:
+    """アスペクト比を保ったままboxに収まる大きさ (画像やboxの大きさが不正ならそのまま。最低1ピクセル)"""
+    original_width, original_height = image_size
+    box_width, box_height = box
+    if original_width > 0 and original_height > 0 and box_width > 0 and box_height > 0: # ゼロ除算回避
+        ratio = min(box_width / original_width, box_height / original_height)
+    else:
+        ratio = 1 # リサイズしない
+    return max(int(original_width * ratio), 1), max(int(original_height * ratio), 1)
+
+
+def upcoming_indices(current, count, ahead=DEFAULT_PREFETCH_AHEAD) -> list[int]:
+    """currentの次からahead枚分のスライド番号 (末尾からは先頭に戻る。currentは含めない)"""
+    if count == 0:
+        return []
+    return [(current + offset) % count for offset in range(1, min(ahead, count - 1) + 1)]
+
+
+class SlidePrefetcher:
+    """次に表示するスライドを別スレッドでデコード・縮小しておく (表示側はPhotoImageを作るだけで済む)"""
+
+    def __init__(self, decode, max_items=DEFAULT_PREFETCH_ITEMS, workers=1):
+        self.decode = decode # decode(index, size) -> 縮小済みのPIL.Image (先読みスレッドから呼ばれる)
+        self.max_items = max_items
+        self._futures = OrderedDict() # (スライド番号, サイズ) -> Future (末尾が最近頼まれたもの)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="slide-prefetch")
+        self.hits = 0 # 先読みが間に合った
+        self.waits = 0 # 先読みの途中で、終わるまで待った
+        self.misses = 0 # 先読みしておらず、呼び出したスレッドでデコードした
+
+    def request(self, indices, size):
+        """indicesのスライドをsizeで先読みする (先読み済み・先読み中のものはそのまま使う。失敗したものはやり直す)"""
+        size = (int(size[0]), int(size[1]))
+        with self._lock:
+            for index in indices:
+                key = (index, size)
+                future = self._futures.get(key)
+                if future is not None and not _failed(future):
+                    self._futures.move_to_end(key)
+                    continue
+                self._futures[key] = self._executor.submit(self.decode, index, size)
+            while len(self._futures) > self.max_items:
+                _, future = self._futures.popitem(last=False)
+                future.cancel() # まだ始まっていなければデコードしない
+
+    def get(self, index, size):
+        """先読みの結果を返す (先読み中なら終わるのを待ち、先読みしていない・失敗していたらこのスレッドでデコードする)"""
+        size = (int(size[0]), int(size[1]))
+        key = (index, size)
+        with self._lock:
+            future = self._futures.get(key)
+            if future is not None and _failed(future):
+                del self._futures[key] # 失敗した結果は残さず、次に表示するときにやり直す
+                future = None
+            elif future is not None:
+                self._futures.move_to_end(key)
+        if future is not None and not future.cancelled():
+            if future.done():
+                self.hits += 1
+            else:
+                self.waits += 1
+            try:
+                return future.result()
+            except Exception:
+                with self._lock:
+                    if self._futures.get(key) is future:
+                        del self._futures[key] # 待っている間に失敗した
+                raise
+        self.misses += 1
+        image = self.decode(index, size)
+        with self._lock:
+            self._futures[key] = _completed(image) # 表示中のスライドも仮表示の元として残しておく
+            self._futures.move_to_end(key)
+        return image
+
+    def latest(self, index):
+        """indexのスライドの、デコード済みの結果を返す (サイズは問わない。なければNone)"""
+        with self._lock:
+            for (future_index, _), future in reversed(self._futures.items()):
+                if future_index == index and future.done() and not future.cancelled() and future.exception() is None:
+                    return future.result()
+        return None
+
+    def retain(self, indices):
+        """indicesに含まれないスライドの先読み結果を捨てる (表示中の前後だけをメモリに残す)"""
+        keep = set(indices)
+        with self._lock:
+            for key in [key for key in self._futures if key[0] not in keep]:
+                self._futures.pop(key).cancel()
+
+    def clear(self):
+        """先読み結果を捨てる (スライドの一覧を読み込み直すときなど)"""
+        with self._lock:
+            for future in self._futures.values():
+                future.cancel()
+            self._futures.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(1 for future in self._futures.values() if not future.done())
+            return {"hits": self.hits, "waits": self.waits, "misses": self.misses,
+                    "items": len(self._futures), "pending": pending}
+
+    def shutdown(self):
+        self.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _failed(future) -> bool:
+    """取り消されたか、例外で終わった"""
+    return future.done() and (future.cancelled() or future.exception() is not None)
+
+
+def _completed(result) -> Future:
+    future = Future()
+    future.set_result(result)
+    return future
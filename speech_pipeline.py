@@ -0,0 +1,218 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- 文分割の設定 ---
+SENTENCE_ENDINGS = "。！？!?…\n" # ここで必ず区切る
+CLAUSE_ENDINGS = "、，," # 十分な長さがあればここでも区切る
+DEFAULT_CLAUSE_MIN_CHARS = 8 # 読点で区切るときの最小文字数 (短すぎる断片は合成効率が悪い)
+
+
+class SentenceSplitter:
+    """少しずつ届くテキストを文・節単位に区切る (句読点は直前の断片に残す)"""
+
+    def __init__(self, clause_min_chars=DEFAULT_CLAUSE_MIN_CHARS):
+        self.clause_min_chars = clause_min_chars
+        self.current = ""
+
+    def feed(self, text: str) -> list[str]:
+        """届いたテキストを加え、区切りまで揃った断片を返す"""
+        chunks = []
+        for char in text:
+            self.current += char
+            if char in SENTENCE_ENDINGS or (char in CLAUSE_ENDINGS and len(self.current) >= self.clause_min_chars):
+                if self.current.strip():
+                    chunks.append(self.current.strip())
+                self.current = ""
+        return chunks
+
+    def flush(self) -> list[str]:
+        """区切りのないまま残っている断片を返す"""
+        rest = self.current.strip()
+        self.current = ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str, clause_min_chars=DEFAULT_CLAUSE_MIN_CHARS) -> list[str]:
+    """テキストを文・節単位に分割する (句読点は直前の断片に残す)"""
+    splitter = SentenceSplitter(clause_min_chars)
+    return splitter.feed(text) + splitter.flush()
+
+
+class SpeechPipeline:
+    """文ごとに並列で合成し、最初の文ができしだい順番どおり続けて再生する"""
+
+    def __init__(self, synthesize, play, max_workers=4, clause_min_chars=DEFAULT_CLAUSE_MIN_CHARS,
+                 synthesize_async=None, synthesize_batch_async=None, reports_sound_start=False):
+        self.synthesize = synthesize # text -> bytes | None (スレッドプールで実行)
+        self.synthesize_async = synthesize_async # async text -> bytes | None (イベントループ上で実行)
+        self.synthesize_batch_async = synthesize_batch_async # async list[text] -> list[bytes | None] (1往復で合成)
+        self.play = play # bytes -> None (再生キューに積むだけでもよい)
+        # Trueなら最初の文をplay(wav, on_start=...)で渡し、実際に音が出始めた時点を知らせてもらう
+        # (Falseなら、最初の文をplayに渡した時点を最初の音とみなす)
+        self.reports_sound_start = reports_sound_start
+        self.clause_min_chars = clause_min_chars
+        self.executor = None
+        if synthesize is not None:
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="synthesis")
+        self._generation = 0 # interruptのたびに増やす (次の発話が始まっても、前の発話の続きを流さない)
+
+    def speak(self, text: str) -> dict:
+        """テキストを読み上げ、計測値 (最初の音までの時間など) を返す"""
+        generation = self._generation
+        started = time.perf_counter()
+        chunks = split_sentences(text, self.clause_min_chars)
+        # 全ての文を先に投入しておき、再生中に後続の文を合成させる
+        futures = [self.executor.submit(self.synthesize, chunk) for chunk in chunks]
+
+        metrics = self._new_metrics(len(chunks))
+        for future in futures:
+            if self._generation != generation:
+                break
+            try:
+                wav = future.result()
+            except Exception as e:
+                print(f"文の音声合成中にエラー: {e}")
+                wav = None
+            self._deliver(wav, metrics, started, generation)
+
+        for future in futures:
+            future.cancel() # 中断時はまだ始まっていない合成を取り消す
+        metrics["total_time"] = time.perf_counter() - started
+        return metrics
+
+    async def speak_async(self, text: str) -> dict:
+        """speakのasyncio版 (スレッドを増やさずイベントループ上で全文を並行に合成する)"""
+        generation = self._generation
+        started = time.perf_counter()
+        chunks = split_sentences(text, self.clause_min_chars)
+        tasks = [asyncio.ensure_future(self.synthesize_async(chunk)) for chunk in chunks]
+
+        metrics = self._new_metrics(len(chunks))
+        try:
+            for task in tasks:
+                if self._generation != generation:
+                    break
+                try:
+                    wav = await task
+                except Exception as e:
+                    print(f"文の音声合成中にエラー: {e}")
+                    wav = None
+                self._deliver(wav, metrics, started, generation)
+        finally:
+            for task in tasks:
+                task.cancel()
+        metrics["total_time"] = time.perf_counter() - started
+        return metrics
+
+    async def speak_batch_async(self, text: str) -> dict:
+        """全文を1回の一括合成にまとめてから再生する (往復回数は最少、最初の音は全文の合成後)"""
+        generation = self._generation
+        started = time.perf_counter()
+        chunks = split_sentences(text, self.clause_min_chars)
+
+        metrics = self._new_metrics(len(chunks))
+        try:
+            wavs = await self.synthesize_batch_async(chunks)
+        except Exception as e:
+            print(f"一括音声合成中にエラー: {e}")
+            wavs = []
+        for wav in wavs:
+            if self._generation != generation:
+                break
+            self._deliver(wav, metrics, started, generation)
+        metrics["total_time"] = time.perf_counter() - started
+        return metrics
+
+    async def speak_stream_async(self, pieces) -> dict:
+        """少しずつ届くテキスト (LLMのトークン出力など) を、文が揃ったものから合成・再生する"""
+        generation = self._generation
+        started = time.perf_counter()
+        splitter = SentenceSplitter(self.clause_min_chars)
+        tasks = asyncio.Queue() # 文ごとの合成タスク (Noneで終わり)
+        received = []
+        metrics = self._new_metrics(0)
+
+        async def produce():
+            try:
+                async for piece in pieces:
+                    if self._generation != generation:
+                        break
+                    received.append(piece)
+                    for chunk in splitter.feed(piece):
+                        tasks.put_nowait(asyncio.ensure_future(self.synthesize_async(chunk)))
+                for chunk in splitter.flush():
+                    tasks.put_nowait(asyncio.ensure_future(self.synthesize_async(chunk)))
+            except Exception as e:
+                print(f"応答テキストの受信中にエラー: {e}")
+            finally:
+                tasks.put_nowait(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while self._generation == generation:
+                try:
+                    task = await asyncio.wait_for(tasks.get(), timeout=0.1) # 中断されたかを定期的に確認する
+                except asyncio.TimeoutError:
+                    continue
+                if task is None:
+                    break
+                metrics["chunks"] += 1
+                try:
+                    wav = await task
+                except Exception as e:
+                    print(f"文の音声合成中にエラー: {e}")
+                    wav = None
+                self._deliver(wav, metrics, started, generation)
+        finally:
+            producer.cancel()
+            while not tasks.empty():
+                task = tasks.get_nowait()
+                if task is not None:
+                    task.cancel()
+        metrics["text"] = "".join(received)
+        metrics["total_time"] = time.perf_counter() - started
+        return metrics
+
+    def interrupt(self):
+        """再生待ちの文を破棄して、現在の発話を打ち切る (次の発話が始まった後も、打ち切った発話の続きは流さない)"""
+        self._generation += 1
+
+    def prefetch(self, text: str) -> list:
+        """読み上げ時と同じ単位に分割して合成だけ行う (事前合成用)"""
+        return [self.executor.submit(self.synthesize, chunk) for chunk in split_sentences(text, self.clause_min_chars)]
+
+    async def prefetch_async(self, text: str) -> list:
+        """prefetchのasyncio版 (各文の結果をリストで返す)"""
+        chunks = split_sentences(text, self.clause_min_chars)
+        return await asyncio.gather(*(self.synthesize_async(chunk) for chunk in chunks), return_exceptions=True)
+
+    def shutdown(self):
+        """合成用スレッドを止める"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- 内部処理 ---
+    @staticmethod
+    def _new_metrics(chunk_count):
+        return {
+            "chunks": chunk_count,
+            "chunks_played": 0,
+            "time_to_first_chunk": None, # 最初の文を再生に渡すまでの時間
+            "time_to_first_sound": None, # 最初の文が実際に鳴り始めるまでの時間 (再生側が知らせる)
+            "total_time": None,
+        }
+
+    def _deliver(self, wav, metrics, started, generation):
+        """合成済みの文を再生に回し、最初の音までの時間を記録する (generationの発話が打ち切られていれば捨てる)"""
+        if not wav or self._generation != generation:
+            return
+        if metrics["time_to_first_chunk"] is not None:
+            self.play(wav)
+        elif self.reports_sound_start:
+            metrics["time_to_first_chunk"] = time.perf_counter() - started
+            self.play(wav, on_start=lambda: metrics.__setitem__("time_to_first_sound", time.perf_counter() - started))
+        else:
+            metrics["time_to_first_chunk"] = metrics["time_to_first_sound"] = time.perf_counter() - started
+            self.play(wav)
+        metrics["chunks_played"] += 1
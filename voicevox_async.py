@@ -0,0 +1,168 @@
+import asyncio
+import io
+import json
+import threading
+import time
+import zipfile
+
+import aiohttp
+
+from voicevox_client import (BATCH_UNSUPPORTED_STATUSES, DEFAULT_BACKOFF, DEFAULT_HOST, DEFAULT_POOL_SIZE,
+                             DEFAULT_PORT, DEFAULT_RETRIES, DEFAULT_SPEAKER, DEFAULT_VERSION_RETRY_SECONDS)
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class AsyncVoicevoxClient:
+    """asyncio版のVOICEVOXクライアント (同時リクエスト数をセマフォで制限する)"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, speaker=DEFAULT_SPEAKER,
+                 max_concurrency=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF,
+                 query_timeout=10, synthesis_timeout=20, version_retry_seconds=DEFAULT_VERSION_RETRY_SECONDS):
+        self.base_url = f"http://{host}:{port}"
+        self.speaker = speaker
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.query_timeout = query_timeout
+        self.synthesis_timeout = synthesis_timeout
+        self.version_retry_seconds = version_retry_seconds
+        self._engine_version = None
+        self._version_retry_at = 0.0 # 取得に失敗したら、この時刻 (time.monotonic) までは問い合わせない
+        # セッションとセマフォはイベントループ上で初めて使うときに作る
+        self._session = None
+        self._semaphore = None
+        self._version_lock = None
+        self.batch_supported = True # /multi_synthesisが使えないと分かったらFalseにする
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._version_lock = asyncio.Lock()
+        return self._session
+
+    async def _request(self, method, path, timeout, read_body, **kwargs):
+        """リクエストを送り、接続エラー・5xxの場合はバックオフしながら再試行する"""
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                async with self._semaphore:
+                    async with session.request(method, f"{self.base_url}{path}", timeout=client_timeout, **kwargs) as res:
+                        if res.status in RETRY_STATUSES and attempt < self.retries:
+                            raise aiohttp.ServerConnectionError(f"{res.status} {res.reason}")
+                        res.raise_for_status()
+                        return await read_body(res)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.retries:
+                    raise
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def audio_query(self, text: str, speaker: int | None = None) -> dict | None:
+        """音声合成用のクエリを作成する"""
+        params = {"text": text, "speaker": self.speaker if speaker is None else speaker}
+        try:
+            return await self._request("POST", "/audio_query", self.query_timeout, lambda res: res.json(), params=params)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"\nAudio Queryエラー: {e}")
+            return None
+
+    async def synthesis(self, query_data: dict, speaker: int | None = None) -> bytes | None:
+        """音声合成を実行する"""
+        params = {"speaker": self.speaker if speaker is None else speaker}
+        headers = {"content-type": "application/json"}
+        try:
+            return await self._request(
+                "POST", "/synthesis", self.synthesis_timeout, lambda res: res.read(),
+                params=params, data=json.dumps(query_data), headers=headers
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"\nSynthesisエラー: {e}")
+            return None
+
+    async def multi_synthesis(self, queries: list[dict], speaker: int | None = None) -> list[bytes] | None:
+        """複数のクエリを1回のリクエストで合成する (WAVのリストを順番どおり返す)"""
+        if not self.batch_supported:
+            return None
+        params = {"speaker": self.speaker if speaker is None else speaker}
+        headers = {"content-type": "application/json"}
+        try:
+            archive = await self._request(
+                "POST", "/multi_synthesis", self.synthesis_timeout * max(1, len(queries)), lambda res: res.read(),
+                params=params, data=json.dumps(queries), headers=headers
+            )
+            with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+                return [zf.read(name) for name in sorted(zf.namelist())]
+        except aiohttp.ClientResponseError as e:
+            if e.status in BATCH_UNSUPPORTED_STATUSES:
+                self.batch_supported = False
+                print("このエンジンは/multi_synthesisに対応していないため、1件ずつ合成します。")
+            else:
+                print(f"\nMulti Synthesisエラー: {e}")
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError, zipfile.BadZipFile) as e:
+            print(f"\nMulti Synthesisエラー: {e}")
+            return None
+
+    async def synthesis_batch(self, queries: list[dict], speaker: int | None = None) -> list[bytes | None]:
+        """まとめて合成し、一括APIが使えなければ1件ずつ並行に合成する (失敗した文だけNoneになる)"""
+        wavs = await self.multi_synthesis(queries, speaker)
+        if wavs is None or len(wavs) != len(queries):
+            wavs = await asyncio.gather(*(self.synthesis(query, speaker) for query in queries))
+        return list(wavs)
+
+    async def version(self) -> str | None:
+        """エンジンのバージョン文字列を取得する"""
+        try:
+            return await self._request("GET", "/version", 2, lambda res: res.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            print(f"VOICEVOXエンジンへの接続中にエラー: {e}")
+            return None
+
+    async def engine_version(self) -> str:
+        """エンジンのバージョンを一度だけ問い合わせて保持する (キャッシュキー用。失敗したらしばらく"unknown"を返す)"""
+        if self._engine_version is None and time.monotonic() >= self._version_retry_at:
+            self._get_session()
+            async with self._version_lock: # 同時に呼ばれても問い合わせは1回にまとめる
+                if self._engine_version is None and time.monotonic() >= self._version_retry_at:
+                    self._engine_version = await self.version()
+                    if self._engine_version is None:
+                        self._version_retry_at = time.monotonic() + self.version_retry_seconds
+        return self._engine_version or "unknown"
+
+    async def close(self):
+        """セッションを閉じる"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class EventLoopThread:
+    """バックグラウンドのスレッド1本でasyncioのイベントループを回し続ける"""
+
+    def __init__(self, name="voicevox-loop"):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """別スレッド (Tkなど) からコルーチンを投入し、concurrent.futures.Futureを返す"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        future.add_done_callback(self._report_error)
+        return future
+
+    @staticmethod
+    def _report_error(future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"バックグラウンド処理でエラー: {future.exception()}")
+
+    def stop(self, timeout=2):
+        """ループを止めてスレッドの終了を待つ"""
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout)
@@ -0,0 +1,153 @@
+import io
+import json
+import sys
+import time
+import zipfile
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# --- VOICEVOX接続の既定値 ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = "50021"
+DEFAULT_SPEAKER = 8 # 8 つむぎ
+DEFAULT_POOL_SIZE = 4 # 同時に保持するキープアライブ接続数
+DEFAULT_RETRIES = 2 # 接続失敗・5xx時の再試行回数
+DEFAULT_BACKOFF = 0.2 # 再試行間隔の係数 (0.2, 0.4, 0.8秒...)
+BATCH_UNSUPPORTED_STATUSES = (404, 405, 501) # 一括合成APIがないエンジンが返すステータス
+DEFAULT_VERSION_RETRY_SECONDS = 30 # バージョンを取得できなかったとき、次に問い合わせるまでの間隔 (秒)
+
+
+class VoicevoxClient:
+    """VOICEVOXエンジンへの接続をプールして再利用するクライアント"""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, speaker=DEFAULT_SPEAKER,
+                 pool_size=DEFAULT_POOL_SIZE, retries=DEFAULT_RETRIES, backoff_factor=DEFAULT_BACKOFF,
+                 query_timeout=10, synthesis_timeout=20, version_retry_seconds=DEFAULT_VERSION_RETRY_SECONDS):
+        self.base_url = f"http://{host}:{port}"
+        self.speaker = speaker
+        self.query_timeout = query_timeout
+        self.synthesis_timeout = synthesis_timeout
+        self.version_retry_seconds = version_retry_seconds
+        self._engine_version = None
+        self._version_retry_at = 0.0 # 取得に失敗したら、この時刻 (time.monotonic) までは問い合わせない
+        self.batch_supported = True # /multi_synthesisが使えないと分かったらFalseにする
+
+        # audio_query/synthesisは冪等なので、POSTも再試行対象に含める
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+
+    def audio_query(self, text: str, speaker: int | None = None) -> dict | None:
+        """音声合成用のクエリを作成する"""
+        params = {"text": text, "speaker": self.speaker if speaker is None else speaker}
+        try:
+            res = self.session.post(
+                f"{self.base_url}/audio_query",
+                params=params,
+                timeout=self.query_timeout
+            )
+            res.raise_for_status() # エラーがあれば例外を発生
+            return res.json()
+        except requests.exceptions.RequestException as e:
+            print(f"\nAudio Queryエラー: {e}")
+            return None
+
+    def synthesis(self, query_data: dict, speaker: int | None = None) -> bytes | None:
+        """音声合成を実行する"""
+        params = {"speaker": self.speaker if speaker is None else speaker}
+        headers = {"content-type": "application/json"}
+        try:
+            res = self.session.post(
+                f"{self.base_url}/synthesis",
+                data=json.dumps(query_data),
+                params=params,
+                headers=headers,
+                timeout=self.synthesis_timeout
+            )
+            res.raise_for_status()
+            return res.content
+        except requests.exceptions.RequestException as e:
+            print(f"\nSynthesisエラー: {e}")
+            return None
+
+    def multi_synthesis(self, queries: list[dict], speaker: int | None = None) -> list[bytes] | None:
+        """複数のクエリを1回のリクエストで合成する (WAVのリストを順番どおり返す)"""
+        if not self.batch_supported:
+            return None
+        params = {"speaker": self.speaker if speaker is None else speaker}
+        headers = {"content-type": "application/json"}
+        try:
+            res = self.session.post(
+                f"{self.base_url}/multi_synthesis",
+                data=json.dumps(queries),
+                params=params,
+                headers=headers,
+                timeout=self.synthesis_timeout * max(1, len(queries))
+            )
+            if res.status_code in BATCH_UNSUPPORTED_STATUSES:
+                self.batch_supported = False
+                print("このエンジンは/multi_synthesisに対応していないため、1件ずつ合成します。")
+                return None
+            res.raise_for_status()
+            with zipfile.ZipFile(io.BytesIO(res.content)) as zf: # 001.wav, 002.wav... の順に入っている
+                return [zf.read(name) for name in sorted(zf.namelist())]
+        except (requests.exceptions.RequestException, zipfile.BadZipFile) as e:
+            print(f"\nMulti Synthesisエラー: {e}")
+            return None
+
+    def synthesis_batch(self, queries: list[dict], speaker: int | None = None) -> list[bytes | None]:
+        """まとめて合成し、一括APIが使えなければ1件ずつ合成する (失敗した文だけNoneになる)"""
+        wavs = self.multi_synthesis(queries, speaker)
+        if wavs is None or len(wavs) != len(queries):
+            wavs = [self.synthesis(query, speaker) for query in queries]
+        return wavs
+
+    def version(self, timeout=2) -> str | None:
+        """エンジンのバージョン文字列を取得する"""
+        try:
+            res = self.session.get(f"{self.base_url}/version", timeout=timeout)
+            res.raise_for_status()
+            return res.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"VOICEVOXエンジンへの接続中にエラー: {e}", file=sys.stderr)
+            return None
+
+    def engine_version(self) -> str:
+        """エンジンのバージョンを一度だけ問い合わせて保持する (キャッシュキー用。失敗したらしばらく"unknown"を返す)"""
+        if self._engine_version is None and time.monotonic() >= self._version_retry_at:
+            self._engine_version = self.version()
+            if self._engine_version is None:
+                self._version_retry_at = time.monotonic() + self.version_retry_seconds
+        return self._engine_version or "unknown"
+
+    def check_engine(self) -> bool:
+        """エンジンが応答するか確認する"""
+        engine_version = self.version()
+        if engine_version is None:
+            print("VOICEVOXアプリが起動しているか、ホスト/ポート設定が正しいか確認してください。", file=sys.stderr)
+            print(f"URL: {self.base_url}", file=sys.stderr)
+            return False
+        self._engine_version = engine_version
+        print(f"VOICEVOXエンジン接続確認 OK (version {engine_version})")
+        return True
+
+    def close(self):
+        """プールしている接続をすべて閉じる"""
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
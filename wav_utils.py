@@ -0,0 +1,73 @@
+import struct
+from typing import NamedTuple
+
+import numpy as np
+
+# --- WAVフォーマットの定数 ---
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# (フォーマット, ビット深度) -> numpyのdtype
+_SAMPLE_DTYPES = {
+    (WAVE_FORMAT_PCM, 8): np.uint8,
+    (WAVE_FORMAT_PCM, 16): np.int16,
+    (WAVE_FORMAT_PCM, 32): np.int32,
+    (WAVE_FORMAT_IEEE_FLOAT, 32): np.float32,
+    (WAVE_FORMAT_IEEE_FLOAT, 64): np.float64,
+}
+
+
+class WavFormat(NamedTuple):
+    """WAVヘッダー (fmtチャンク) から読み取った形式"""
+    format_tag: int
+    channels: int
+    sample_rate: int
+    bits_per_sample: int
+
+    @property
+    def dtype(self):
+        dtype = _SAMPLE_DTYPES.get((self.format_tag, self.bits_per_sample))
+        if dtype is None:
+            raise ValueError(f"未対応のWAV形式です (format={self.format_tag:#06x}, {self.bits_per_sample}bit)")
+        return dtype
+
+
+def parse_wav(wav_data) -> tuple[WavFormat, memoryview]:
+    """RIFFヘッダーを解釈し、形式とPCM部分のmemoryview (コピーなし) を返す"""
+    view = memoryview(wav_data)
+    if len(view) < 12 or view[0:4] != b"RIFF" or view[8:12] != b"WAVE":
+        raise ValueError("WAVデータではありません (RIFF/WAVEヘッダーがありません)")
+
+    wav_format = None
+    offset = 12
+    while offset + 8 <= len(view):
+        chunk_id = bytes(view[offset:offset + 4])
+        chunk_size = struct.unpack_from("<I", view, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate = struct.unpack_from("<HHI", view, body)
+            bits_per_sample = struct.unpack_from("<H", view, body + 14)[0]
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                format_tag = struct.unpack_from("<H", view, body + 24)[0] # SubFormat GUIDの先頭2バイト
+            wav_format = WavFormat(format_tag, channels, sample_rate, bits_per_sample)
+        elif chunk_id == b"data":
+            if wav_format is None:
+                raise ValueError("dataチャンクの前にfmtチャンクがありません")
+            # ストリーミング出力などでサイズが不正な場合は末尾までをPCMとみなす
+            end = min(body + chunk_size, len(view))
+            block_align = wav_format.channels * wav_format.bits_per_sample // 8
+            end -= (end - body) % block_align if block_align else 0
+            return wav_format, view[body:end]
+        offset = body + chunk_size + (chunk_size & 1) # チャンクは2バイト境界に揃えられている
+
+    raise ValueError("WAVデータにdataチャンクがありません")
+
+
+def decode_wav(wav_data) -> tuple[np.ndarray, int]:
+    """WAVを (フレーム数, チャンネル数) のnumpy配列とサンプリングレートに変換する (コピーなし)"""
+    wav_format, pcm = parse_wav(wav_data)
+    samples = np.frombuffer(pcm, dtype=wav_format.dtype)
+    if wav_format.channels > 1:
+        samples = samples.reshape(-1, wav_format.channels)
+    return samples, wav_format.sample_rate
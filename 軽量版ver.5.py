@@ -1,71 +1,191 @@
 import tkinter as tk
 from tkinter import ttk
-import requests
-import json
-import sounddevice as sd
-import numpy as np
 import speech_recognition as sr
 import time
 import sys
 import threading
+import asyncio
+from contextlib import nullcontext
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import cv2  # Import OpenCV
 import os
+from voicevox_client import VoicevoxClient
+from voicevox_async import AsyncVoicevoxClient, EventLoopThread
+from audio_playback import PlaybackService
+from audio_cache import AudioCache, QueryCache, adjust_query
+from speech_pipeline import SpeechPipeline
+from perf_trace import Tracer, StatsPanel
+from noise_floor import NoiseFloorTracker
+from audio_capture import CaptureService
+from recognizer_backends import RecognizerBackend, create_backend
+from intent_matcher import IntentMatch, IntentTable
+from image_cache import ResizedImageCache
+from resize_scheduler import ResizeScheduler
+from slide_loader import SlideCatalogue, SlidePrefetcher, fit_size, upcoming_indices
+from derivative_store import DerivativeStore
+from response_backends import create_router
+
+# --- 計測 (トレース) の設定 ---
+trace_log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "trace.jsonl") # ローテーションするJSONLファイル
+frame_log_threshold_ms = 50 # 描画処理はこの時間を超えたフレームだけファイルに記録する (集計は全フレーム)
+tracer = Tracer(trace_log_path)
 
 # --- VOICEVOX関連の設定 ---
 host = "127.0.0.1"
 port = "50021"
 speaker = 8 # 話者を指定 (例: 8 つむぎ)
+pool_size = 4 # キープアライブ接続の最大数
+retries = 2 # 接続失敗・5xx時の再試行回数
+backoff_factor = 0.2 # 再試行間隔の係数 (秒)
+
+# 発話ごとにTCP接続を張り直さないよう、同じクライアントを使い回す
+voicevox = VoicevoxClient(host, port, speaker, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
+
+# 会話中の合成は、バックグラウンドのイベントループ1本で並行に処理する (発話ごとにスレッドを作らない)
+async_voicevox = AsyncVoicevoxClient(host, port, speaker, max_concurrency=pool_size, retries=retries, backoff_factor=backoff_factor)
+engine_loop = EventLoopThread()
 
 def post_audio_query(text: str) -> dict | None:
     """音声合成用のクエリを作成する"""
-    params = {"text": text, "speaker": speaker}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/audio_query",
-            params=params,
-            timeout=10 # タイムアウト設定
-        )
-        res.raise_for_status() # エラーがあれば例外を発生
-        return res.json()
-    except requests.exceptions.RequestException as e:
-        print(f"\nAudio Queryエラー: {e}")
-        return None
+    return voicevox.audio_query(text)
 
 def post_synthesis(query_data: dict) -> bytes | None:
     """音声合成を実行する"""
-    params = {"speaker": speaker}
-    headers = {"content-type": "application/json"}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/synthesis",
-            data=json.dumps(query_data),
-            params=params,
-            headers=headers,
-            timeout=20 # タイムアウト設定 (合成は時間がかかる場合がある)
-        )
-        res.raise_for_status()
-        return res.content
-    except requests.exceptions.RequestException as e:
-        print(f"\nSynthesisエラー: {e}")
+    return voicevox.synthesis(query_data)
+
+# 音声クエリに上書きする値 (例: {"outputSamplingRate": 16000} で再生負荷を下げる)
+synthesis_params = {}
+
+# 複数文の応答の合成方法
+# "stream": 文ごとに並行して合成し、最初の文ができしだい再生する (最初の音が早い)
+# "batch": /multi_synthesisで全文を1往復にまとめる (リクエスト数が少ない。未対応のエンジンでは1件ずつ合成)
+synthesis_mode = "stream"
+
+# --- 合成済み音声のキャッシュ設定 ---
+audio_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "voice_cache")
+audio_cache = AudioCache(audio_cache_dir, memory_items=32, disk_max_bytes=64 * 1024 * 1024)
+# アクセント・モーラ解析の結果 (audio_query) は話速などを変えても使い回せるので別に保持する
+query_cache = QueryCache(max_items=256, ttl_seconds=24 * 60 * 60)
+
+def set_prosody(speed_scale=None, pitch_scale=None, intonation_scale=None, volume_scale=None):
+    """話速・音高・抑揚・音量を実行中に変更する (解析済みのクエリを再利用するので/audio_queryは呼ばれない)"""
+    adjusted = adjust_query({}, speed_scale, pitch_scale, intonation_scale, volume_scale)
+    synthesis_params.update(adjusted)
+
+def get_audio_query(text: str) -> dict | None:
+    """キャッシュを優先して音声クエリを取得する (返り値は書き換えてよい複製)"""
+    key = query_cache.make_key(text, speaker, voicevox.engine_version())
+    query = query_cache.get(key)
+    if query is None:
+        query = post_audio_query(text)
+        if query is not None:
+            query_cache.put(key, query)
+    return query
+
+async def get_audio_query_async(text: str) -> dict | None:
+    """get_audio_queryのasyncio版"""
+    key = query_cache.make_key(text, speaker, await async_voicevox.engine_version())
+    query = query_cache.get(key)
+    if query is None:
+        query = await async_voicevox.audio_query(text)
+        if query is not None:
+            query_cache.put(key, query)
+    return query
+
+def synthesize_text(text: str, query_params: dict | None = None) -> bytes | None:
+    """キャッシュを優先してテキストを音声データに変換する (定型応答は2回目以降即再生)"""
+    if query_params is None:
+        query_params = synthesis_params
+    key = audio_cache.make_key(text, speaker, voicevox.engine_version(), query_params)
+    wav = audio_cache.get(key)
+    if wav is not None:
+        return wav
+
+    query = get_audio_query(text)
+    if query is None:
         return None
+    query = adjust_query(query, overrides=query_params) # speedScaleなどの調整値を反映
+    wav = post_synthesis(query)
+    if wav:
+        audio_cache.put(key, wav)
+    return wav
+
+async def synthesize_text_async(text: str, query_params: dict | None = None) -> bytes | None:
+    """synthesize_textのasyncio版 (engine_loop上で実行する)"""
+    if query_params is None:
+        query_params = synthesis_params
+    key = audio_cache.make_key(text, speaker, await async_voicevox.engine_version(), query_params)
+    wav = audio_cache.get(key)
+    if wav is not None:
+        return wav
+
+    query = await get_audio_query_async(text)
+    if query is None:
+        return None
+    query = adjust_query(query, overrides=query_params)
+    wav = await async_voicevox.synthesis(query)
+    if wav:
+        audio_cache.put(key, wav)
+    return wav
+
+async def synthesize_batch_async(texts: list[str], query_params: dict | None = None) -> list[bytes | None]:
+    """複数の文をまとめて合成する (キャッシュにない文だけを1回の一括合成に載せる)"""
+    if query_params is None:
+        query_params = synthesis_params
+    engine_version = await async_voicevox.engine_version()
+    keys = [audio_cache.make_key(text, speaker, engine_version, query_params) for text in texts]
+    wavs = [audio_cache.get(key) for key in keys]
+    missing = [i for i, wav in enumerate(wavs) if wav is None]
+    if not missing:
+        return wavs
+
+    queries = await asyncio.gather(*(get_audio_query_async(texts[i]) for i in missing))
+    pending = [(i, adjust_query(query, overrides=query_params)) for i, query in zip(missing, queries) if query is not None]
+    results = await async_voicevox.synthesis_batch([query for _, query in pending]) if pending else []
+    for (i, _), wav in zip(pending, results):
+        if wav: # 失敗した文だけ飛ばし、合成できた文は話す
+            wavs[i] = wav
+            audio_cache.put(keys[i], wav)
+    return wavs
+
+# 出力デバイスは開いたままにして、発話ごとの開き直しを避ける
+playback = PlaybackService()
 
 def play_wavfile(wav_data: bytes | None):
-    """音声を再生する"""
-    if wav_data is None:
-        return
-    try:
-        sample_rate = 24000 # VOICEVOXのデフォルトサンプリングレート
-        wav_array = np.frombuffer(wav_data, dtype=np.int16)
-        sd.play(wav_array, sample_rate)
-        sd.wait() # 再生が終わるまで待つ
-    except Exception as e:
-        print(f"\n音声再生エラー: {e}")
-        print("利用可能なオーディオデバイスを確認してください。")
+    """音声を再生する (再生が終わるまで待つ)"""
+    if playback.enqueue(wav_data):
+        playback.wait() # 再生が終わるまで待つ
+
+# 文単位で並列合成し、最初の文ができしだい再生を始める
+speech_pipeline = SpeechPipeline(None, playback.enqueue, synthesize_async=synthesize_text_async, # 再生キューに渡すだけで次の文へ進む (engine_loopを止めない)
+                                 synthesize_batch_async=synthesize_batch_async,
+                                 reports_sound_start=True) # 最初の音は、出力デバイスに渡り始めた時点で計る
+
+# --- 音声認識関連の設定 ---
+recognizer_backend = "google" # "google": Google音声認識 (要インターネット) / "vosk": オフライン認識
+vosk_model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "vosk-model-small-ja-0.22")
+speech_backend = create_backend(recognizer_backend, language="ja-JP", model_path=vosk_model_path)
+noise_recalibration_interval = 30 # 環境ノイズの再調整間隔 (秒)。常時録音中は、発話のない音がこの長さたまるごとに行う
+noise_sample_duration = 0.5 # 1回の再調整で聞く長さ (秒)
+# 常時録音: マイクを開いたままにして、発話区間だけを切り出す
+capture_buffer_seconds = 30 # 録音を保持するリングバッファの長さ (秒)
+vad_pre_roll = 0.3 # 発話開始の判定位置より前に含める長さ (秒)
+vad_pause = 0.6 # この長さ静かになったら発話の終わりとみなす (秒)
+vad_max_utterance = 5.0 # 1回の発話の最大長 (秒)
+# 割り込み (barge-in): 発話中に利用者が話し始めたら、再生を止めて次のターンを始める
+barge_in = True
+barge_in_duration = 0.3 # 再生中は、この長さ以上続けて声を検出したら割り込みとみなす (秒)
+echo_margin = 3.0 # スピーカーからの回り込みの見積もりに対して、この倍率を超えた音を声とみなす
+# ストリーミング認識: 対応するバックエンド (vosk) なら、話している途中の認識結果を表示する
+streaming_recognition = True
+early_response_stable = 0.3 # 途中結果がこの時間 (秒) 変わらず、応答キーワードを含んでいれば発話の終わりを待たずに応答する
 
 # --- 音声認識関連の関数 ---
-def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Microphone) -> dict:
-    """マイクから音声を取得し、テキストに変換する"""
+@tracer.traced()
+def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Microphone,
+                              noise_tracker: NoiseFloorTracker | None = None,
+                              backend: RecognizerBackend | None = None) -> dict:
+    """マイクから音声を取得し、テキストに変換する (noise_trackerが調整済みならノイズ調整を省く)"""
     if not isinstance(recognizer, sr.Recognizer):
         raise TypeError("`recognizer` must be `Recognizer` instance")
     if not isinstance(microphone, sr.Microphone):
@@ -77,15 +197,19 @@ def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Micropho
         "transcription": None
     }
 
-    with microphone as source:
-        print("\nマイクのノイズレベルを調整中...")
+    with (noise_tracker.listening() if noise_tracker else nullcontext()), microphone as source:
         try:
-            # 実際の音声入力の直前にノイズ調整を行う
-            recognizer.adjust_for_ambient_noise(source, duration=1) # 1秒間調整
+            if noise_tracker is None or not noise_tracker.is_calibrated:
+                # まだ調整されていない場合だけ、音声入力の直前にノイズ調整を行う
+                print("\nマイクのノイズレベルを調整中...")
+                with tracer.span("recognize.adjust_for_ambient_noise"):
+                    recognizer.adjust_for_ambient_noise(source, duration=1) # 1秒間調整
             print("どうぞ話してください（2-3秒間）...")
             # タイムアウトとフレーズ制限を短くして応答性を向上
-            audio = recognizer.listen(source, timeout=3, phrase_time_limit=3)
+            with tracer.span("recognize.listen"):
+                audio = recognizer.listen(source, timeout=3, phrase_time_limit=3)
         except sr.WaitTimeoutError:
+            tracer.count("recognize.timeout")
             response["success"] = False
             response["error"] = "タイムアウトしました。音声が検出されませんでした。"
             return response
@@ -94,12 +218,35 @@ def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Micropho
             response["error"] = f"マイクからの音声取得中にエラー: {e}"
             return response
 
+    return recognize_audio(recognizer, audio, backend)
+
+@tracer.traced()
+def recognize_audio(recognizer: sr.Recognizer, audio: sr.AudioData, backend: RecognizerBackend | None = None) -> dict:
+    """録音済みの音声をテキストに変換する (backendを省略した場合はGoogle音声認識)"""
+    if backend is not None:
+        return run_recognition(backend.name, lambda: backend.transcribe(audio))
+    return run_recognition("google", lambda: recognizer.recognize_google(audio, language='ja-JP'))
+
+def run_recognition(backend_name: str, transcribe) -> dict:
+    """認識処理を実行し、結果またはエラーを応答用の辞書にまとめる"""
+    response = {
+        "success": True,
+        "error": None,
+        "transcription": None
+    }
+
     try:
-        response["transcription"] = recognizer.recognize_google(audio, language='ja-JP')
+        with tracer.span(f"recognize.{backend_name}"):
+            response["transcription"] = transcribe()
     except sr.RequestError as e:
+        tracer.count("recognize.request_error")
         response["success"] = False
-        response["error"] = f"Google APIに接続できませんでした; {e}"
+        if backend_name == "google":
+            response["error"] = f"Google APIに接続できませんでした; {e}"
+        else:
+            response["error"] = f"音声認識 ({backend_name}) を使用できませんでした; {e}"
     except sr.UnknownValueError:
+        tracer.count("recognize.unknown_value")
         response["error"] = "音声を認識できませんでした"
     except Exception as e:
         response["success"] = False
@@ -108,35 +255,68 @@ def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Micropho
     return response
 
 # --- 応答生成関数 (シンプルな応答ロジック) ---
+# キーワード・応答・動作の表 (intents.json) を1つのオートマトンにまとめ、発言を1回走査するだけで意図を決める
+intents_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "intents.json")
+intent_fuzzy_threshold = 0.75 # 表記ゆれ・聞き間違いを許す類似度の下限 (Noneで完全一致のみ)
+intent_table = IntentTable.load(intents_path, fuzzy_threshold=intent_fuzzy_threshold)
+
+def match_intent(user_text: str | None) -> IntentMatch:
+    """ユーザーの発言から意図・応答・動作を決める"""
+    intent_match = intent_table.respond(user_text)
+    if intent_match.intent is not None and intent_match.confidence < 1.0:
+        tracer.count("intent.fuzzy_match")
+        print(f"あいまい一致: 「{user_text}」 -> {intent_match.keyword} (類似度 {intent_match.confidence:.2f})")
+    return intent_match
+
+def has_response_keyword(user_text: str) -> bool:
+    """固定の応答が決まるキーワードを含むか (途中結果での先行応答に使うため、あいまい一致は含めない)"""
+    return intent_table.match(user_text, fuzzy=False) is not None
+
 def generate_response(user_text: str | None) -> str:
     """ユーザーの発言に対する応答を生成する"""
-    if user_text:
-        if "こんにちは" in user_text:
-            return "こんにちは！何かお手伝いしましょうか？"
-        elif "ありがとう" in user_text or "どうも" in user_text:
-            return "どういたしまして！"
-        elif "天気" in user_text:
-            return "今日の天気はどうでしょうか？外を見てみてくださいね！"
-        elif "名前" in user_text:
-            return "私はVOICEVOXの連携するAIアシスタントで、声はつむぎが担当しています。"
-        elif "何ができる" in user_text:
-            return "簡単な日常会話や、特定の質問に答えることができますよ。"
-        elif "大きく" in user_text:
-            return "ウィンドウを大きくしますね。"
-        elif "小さく" in user_text:
-            return "ウィンドウを小さくしますね。"
-        elif "スライドショー開始" in user_text: # 新しい音声コマンド
-            return "スライドショーを開始しますね。"
-        elif "スライドショー停止" in user_text: # 新しい音声コマンド
-            return "スライドショーを停止しますね。"
-        elif "次のスライド" in user_text: # 新しい音声コマンド
-            return "次のスライドに切り替えます。"
-        elif "さようなら" in user_text or "バイバイ" in user_text:
-            return "はい、さようなら。またお話ししましょう。"
-        else:
-            return f"「{user_text}」ですね、承知しました。"
-    else:
-        return "すみません、うまく聞き取れませんでした。もう一度お願いします。"
+    return match_intent(user_text).response
+
+# --- 応答バックエンドの設定 ---
+# 意図の表で応答が決まらない発言は、ここに並べた順に応答を試す (期限内に答え始めたものを使い、どれもだめなら意図の表の既定応答)
+# "retrieval": よくある質問 (faq.json) からの検索 / "llm": ローカルのLLMサーバー (llama.cppのserverなど、OpenAI互換API)
+response_backends = ["retrieval", "llm"]
+faq_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faq.json")
+retrieval_min_score = 0.6 # よくある質問との類似度がこれ未満なら検索結果を使わない
+llm_host = "127.0.0.1"
+llm_port = 8080
+llm_first_token_timeout = 2.0 # LLMが最初の文字を返すまでの期限 (秒)。超えたら次のバックエンドへ
+llm_deadline = 8.0 # LLMの応答全体の期限 (秒)。超えたらそこまでで打ち切る
+llm_max_tokens = 120 # 読み上げる応答が長くなりすぎないようにする
+response_router = create_router(response_backends, intent_table, faq_path, retrieval_min_score,
+                                llm_options={"host": llm_host, "port": llm_port, "max_tokens": llm_max_tokens,
+                                             "first_token_timeout": llm_first_token_timeout, "deadline": llm_deadline})
+
+# 起動時に事前合成しておく定型応答 (意図の表の応答と、conversation_loop_guiの固定文)
+RECOGNITION_ERROR_RESPONSE = "すみません、音声の認識で問題がありました。"
+CANNED_RESPONSES = (*intent_table.responses(), intent_table.no_input_response, RECOGNITION_ERROR_RESPONSE)
+
+def check_voicevox_engine():
+    """VOICEVOXエンジンに接続できるか確認する"""
+    try:
+        return voicevox.check_engine()
+    except Exception as e:
+        print(f"エンジン接続確認中に予期せぬエラー: {e}", file=sys.stderr)
+        return False
+
+# --- 画像表示の設定 ---
+# スライドやキャラクター画像のリサイズ結果を、表示サイズごとに保持する (ウィンドウサイズが変わらなければ再利用)
+image_cache_max_bytes = 64 * 1024 * 1024 # 保持するリサイズ済み画像の合計サイズの上限
+image_cache = ResizedImageCache(image_cache_max_bytes)
+# ウィンドウのリサイズ: ドラッグ中は1フレームに1回だけ軽い補間で描き、止まってから高品質で描き直す
+resize_frame_ms = 16 # ドラッグ中の再配置の間隔 (ミリ秒)
+resize_settle_ms = 150 # サイズ変更がこの時間止まったら高品質で描き直す (ミリ秒)
+resize_preview_filter = Image.Resampling.BILINEAR # ドラッグ中の補間方法 (さらに軽くするならNEAREST)
+# スライドの先読み: 次に表示するスライドを別スレッドでデコード・縮小しておき、切り替え時はPhotoImageを作るだけにする
+slide_prefetch_ahead = 2 # 何枚先まで先読みするか
+# スライドの縮小版キャッシュ: 表示サイズに縮小した画像をディスクに保存し、次回の起動では元画像をデコードしない
+slide_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slide_cache")
+slide_cache_max_bytes = 256 * 1024 * 1024 # ディスクに保存する縮小版の合計サイズの上限
+derivative_store = DerivativeStore(slide_cache_dir, slide_cache_max_bytes)
 
 class VoiceChatApp:
     def __init__(self, master):
@@ -237,6 +417,12 @@ class VoiceChatApp:
         self.force_stop_button.pack(side=tk.LEFT, padx=5)
         self.force_stop_button.config(state=tk.DISABLED)
 
+        # 処理時間の統計を表示するボタン (F12キーでも開ける)
+        self.stats_panel = None
+        self.stats_button = ttk.Button(self.button_frame, text="統計", command=self.open_stats_panel)
+        self.stats_button.pack(side=tk.LEFT, padx=5)
+        master.bind("<F12>", lambda event: self.open_stats_panel())
+
         # スライドショー制御ボタンを追加
         self.slideshow_button_frame = ttk.Frame(master)
         self.slideshow_button_frame.pack(pady=5) # 初期状態から表示
@@ -284,18 +470,26 @@ class VoiceChatApp:
 
         self.recognizer = sr.Recognizer()
         self.microphone = None # 初期値をNoneに設定
+        self.noise_tracker = None # マイクの準備ができたら作成する
+        self.capture = None # 常時録音 (マイクの準備ができたら開始する)
+        self.early_response_start = None # 途中結果で先に応答した発話の開始位置 (同じ発話の最終結果は使わない)
 
         self.initialize_microphone() # マイクの初期化を別途関数に切り出す
+        threading.Thread(target=self.load_speech_backend, daemon=True).start() # 認識モデルは最初の発話までに読み込んでおく
 
         self.is_talking = False
         self.conversation_thread = None
 
-        master.bind("<Configure>", self.on_resize)
+        # <Configure>は子ウィジェットの分やドラッグの1ピクセルごとにも届くので、まとめてから再配置する
+        self.resize_scheduler = ResizeScheduler(master, lambda width, height: self.on_resize(width, height, preview=True),
+                                                self.on_resize, frame_ms=resize_frame_ms, settle_ms=resize_settle_ms)
+        master.bind("<Configure>", self.resize_scheduler.on_configure)
 
         # --- スライドショー表示用の設定 ---
         self.slideshow_label = tk.Label(master)
-        self.slideshow_pil_images = [] # PIL.Imageオブジェクトを格納
+        self.slides = SlideCatalogue([]) # スライドのパスとメタデータ (画像は表示するときにデコードする)
         self.slideshow_tk_images = [] # ImageTk.PhotoImageオブジェクトを格納 (参照保持用)
+        self.slide_prefetcher = SlidePrefetcher(self.decode_slide)
         self.current_slide_index = 0
         self.slideshow_interval_ms = 3000 # 3秒ごとに切り替え
         self.slideshow_playing = False
@@ -306,6 +500,53 @@ class VoiceChatApp:
         slides_folder_path = os.path.join(self.base_path, slides_folder_name)
         self.load_slideshow_images(slides_folder_path)
 
+        # 意図の表 (intents.json) の動作名 -> 実行する処理 (応答の文言ではなく動作名で切り替える)
+        self.intent_actions = {
+            "enlarge_window": lambda: self.master.geometry("700x600"),
+            "shrink_window": lambda: self.master.geometry("500x400"),
+            "start_slideshow": self.start_slideshow_playback,
+            "stop_slideshow": self.stop_slideshow_playback,
+            "next_slide": self.next_slide,
+        }
+
+        # エンジンが応答する場合のみ、定型応答を裏で事前合成しておく
+        if check_voicevox_engine():
+            self.start_audio_warmup()
+        else:
+            self.update_chat_log("VOICEVOXエンジンに接続できません。音声は再生されません。", "red")
+
+    def start_audio_warmup(self):
+        """定型応答を並列に事前合成して音声キャッシュに載せる (メインループは止めない)"""
+        phrases = list(CANNED_RESPONSES)
+        total = len(phrases)
+        report_every = max(1, total // 4) # 進捗は約25%ごとに表示
+        self.update_chat_log(f"定型応答の事前合成を開始します ({total}件)...", "green")
+
+        async def warmup_process():
+            done = 0
+            failed = 0
+            # 再生時と同じ文単位で、全ての定型応答を一度に投入して並行に合成する (同時数はクライアント側で制限)
+            tasks = [asyncio.ensure_future(speech_pipeline.prefetch_async(phrase)) for phrase in phrases]
+            for task in tasks:
+                results = await task
+                for result in results:
+                    if isinstance(result, Exception):
+                        print(f"事前合成中にエラー: {result}", file=sys.stderr)
+                done += 1
+                if not all(isinstance(result, bytes) for result in results):
+                    failed += 1
+                if done % report_every == 0 and done < total:
+                    message = f"事前合成中... {done}/{total}"
+                    self.master.after(0, lambda m=message: self.update_chat_log(m))
+
+            if failed:
+                message, color = f"事前合成が完了しました ({total - failed}/{total}件成功)。", "red"
+            else:
+                message, color = f"事前合成が完了しました ({total}件)。", "green"
+            self.master.after(0, lambda: self.update_chat_log(message, color))
+
+        engine_loop.submit(warmup_process())
+
     def initialize_microphone(self):
         """マイクの初期化を試みる"""
         try:
@@ -324,6 +565,23 @@ class VoiceChatApp:
             # デフォルトのマイクを使用するか、特定のデバイスインデックスを指定する
             # 例: self.microphone = sr.Microphone(device_index=1)
             self.microphone = sr.Microphone()
+            # 会話の合間に環境ノイズを測り直し、聞き取りはすぐに始められるようにする
+            self.noise_tracker = NoiseFloorTracker(self.recognizer, self.microphone,
+                                                   recalibration_interval=noise_recalibration_interval,
+                                                   sample_duration=noise_sample_duration)
+            # マイクを開いたまま録音し続け、発話区間をキューに積む (自分の発話中の音は捨てる)
+            self.capture = CaptureService(self.microphone, self.recognizer, self.noise_tracker,
+                                          buffer_seconds=capture_buffer_seconds, pre_roll=vad_pre_roll,
+                                          pause_duration=vad_pause, max_utterance_duration=vad_max_utterance,
+                                          suppress=playback.is_playing,
+                                          on_barge_in=self.on_barge_in if barge_in else None,
+                                          echo_reference=playback.output_energy,
+                                          barge_in_duration=barge_in_duration, echo_margin=echo_margin)
+            if not self.capture.start():
+                # 常時録音できない場合は、従来どおりターンごとにマイクを開く
+                print("常時録音を開始できませんでした。ターンごとにマイクを開きます。", file=sys.stderr)
+                self.capture = None
+                self.noise_tracker.start()
             self.update_chat_log("マイクの準備ができました。", "green")
             self.start_button.config(state=tk.NORMAL) # 成功したらボタンを有効化
 
@@ -334,6 +592,16 @@ class VoiceChatApp:
             self.microphone = None
             self.start_button.config(state=tk.DISABLED) # 失敗したらボタンを無効化
 
+    def load_speech_backend(self):
+        """音声認識バックエンドを準備する (オフライン認識のモデルは一度だけ読み込んで保持する)"""
+        try:
+            with tracer.span("recognize.load_backend", backend=speech_backend.name):
+                speech_backend.load()
+            print(f"音声認識バックエンド: {speech_backend.name}")
+        except sr.RequestError as e:
+            print(f"音声認識バックエンドの準備に失敗しました: {e}", file=sys.stderr)
+            self.master.after(0, lambda m=str(e): self.update_chat_log(f"エラー: 音声認識の準備に失敗しました: {m}", "red"))
+
     def get_image_files(self, folder_path):
         """指定されたフォルダ内の画像ファイルを取得する"""
         image_extensions = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff')
@@ -350,8 +618,8 @@ class VoiceChatApp:
 
     def load_slideshow_images(self, image_folder_path):
         """スライドショー用の画像を読み込む"""
-        self.slideshow_pil_images = [] # PIL Imageオブジェクトを格納
         self.slideshow_tk_images = [] # ImageTk.PhotoImageオブジェクトを格納 (参照保持用)
+        self.slide_prefetcher.clear()
         files = self.get_image_files(image_folder_path)
 
         if not files:
@@ -383,23 +651,25 @@ class VoiceChatApp:
                 except Exception as e:
                     print(f"ダミー画像の生成中にエラーが発生しました: {e}")
 
-        for img_path in files:
-            try:
-                self.slideshow_pil_images.append(Image.open(img_path))
-            except Exception as e:
-                print(f"スライドショー画像 '{img_path}' の読み込み中にエラーが発生しました: {e}")
+        # 大量の高解像度画像でも起動が遅くならないよう、ここではファイルを開かずパスとメタデータだけを記録する
+        self.slides = SlideCatalogue(files)
+        self.current_slide_index = 0
+        # 元ファイルが変わった・消えたスライドの縮小版の削除と、足りない縮小版の作成は裏で行う
+        threading.Thread(target=self.regenerate_slide_derivatives, args=(self.slides,), name="slide-derivatives",
+                         daemon=True).start()
 
-        if not self.slideshow_pil_images:
+        if not self.slides:
             print("スライドショーに表示する画像がありません。")
 
-    def update_slide(self):
-        """現在のスライドを表示する"""
-        if not self.slideshow_pil_images:
+    @tracer.traced(log_threshold_ms=frame_log_threshold_ms)
+    def update_slide(self, preview=False):
+        """現在のスライドを表示する (previewなら軽い補間で仮表示する)"""
+        if not self.slides:
             self.slideshow_label.config(image='')
             self.slideshow_label.image = None # 参照をクリア
             return
 
-        pil_image = self.slideshow_pil_images[self.current_slide_index]
+        slide = self.slides[self.current_slide_index]
 
         # ラベルの現在のサイズを取得
         label_width = self.slideshow_label.winfo_width()
@@ -414,42 +684,86 @@ class VoiceChatApp:
             label_height = max(int(window_height * 0.4), 400)
 
 
-        # 画像のアスペクト比を維持しつつ、ラベルに収まるようにリサイズ
-        original_width, original_height = pil_image.size
-
-        # 幅と高さの比率を計算し、小さい方を選ぶことで画像が収まるようにする
-        if original_width > 0 and original_height > 0 and label_width > 0 and label_height > 0: # ゼロ除算回避
-            ratio_w = label_width / original_width
-            ratio_h = label_height / original_height
-            ratio = min(ratio_w, ratio_h)
-        else: # 画像サイズが不正な場合
-            ratio = 1 # リサイズしない
-
-        new_width = int(original_width * ratio)
-        new_height = int(original_height * ratio)
-
-        # リサイズした画像が0にならないように最低限のサイズを保証
-        if new_width == 0: new_width = 1
-        if new_height == 0: new_height = 1
+        # 画像のアスペクト比を維持しつつ、ラベルに収まるようにリサイズ (縮小版を作り直すときも同じ計算を使う)
+        try:
+            image_size = self.slides.image_size(self.current_slide_index) # 記録済みでなければヘッダーだけを読む
+        except Exception as e:
+            print(f"スライドショー画像 '{slide.path}' の読み込み中にエラーが発生しました: {e}")
+            return
+        new_width, new_height = fit_size(image_size, (label_width, label_height))
 
         try:
-            resized_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            tk_image = ImageTk.PhotoImage(resized_image)
+            # 同じサイズなら2周目からはリサイズしない。先読み済みならPhotoImageを作るだけで済む
+            tk_image = image_cache.lookup(slide, (new_width, new_height))
+            if tk_image is None and preview:
+                # 仮表示は、デコード済みの縮小画像から作る (なければサイズが落ち着いてから描き直す)
+                decoded_image = self.slide_prefetcher.latest(self.current_slide_index)
+                if decoded_image is None:
+                    return
+                tk_image = image_cache.preview(decoded_image, (new_width, new_height), resize_preview_filter)
+            elif tk_image is None:
+                resized_image = self.slide_prefetcher.get(self.current_slide_index, (new_width, new_height))
+                tk_image = image_cache.put(slide, (new_width, new_height), resized_image)
             self.slideshow_label.config(image=tk_image)
             self.slideshow_label.image = tk_image # ガベージコレクションを防ぐための参照保持
+            tracer.count("slide.shown")
         except Exception as e:
             print(f"スライドショー画像のリサイズまたは表示中にエラー: {e}")
+            return
+        if not preview:
+            derivative_store.remember_display_box((label_width, label_height)) # 次回の起動時は、このサイズの縮小版を作っておく (書き出しは別スレッド)
+            self.prefetch_slides((new_width, new_height))
+
+    def prefetch_slides(self, size):
+        """次に表示するスライドを、表示中と同じサイズで先読みしておく (表示用に保持済みのものは除く)"""
+        upcoming = upcoming_indices(self.current_slide_index, len(self.slides), slide_prefetch_ahead)
+        # デコード済みの画像は表示中とその先だけを残し、それ以外は捨ててメモリを抑える
+        self.slide_prefetcher.retain([self.current_slide_index, *upcoming])
+        self.slide_prefetcher.request([index for index in upcoming if not image_cache.contains(self.slides[index], size)], size)
+
+    @tracer.traced()
+    def decode_slide(self, index, size):
+        """スライドを表示サイズで読み込む (ディスクに縮小版があればそれを使い、なければ元画像から作って保存する)"""
+        slide = self.slides[index]
+        image = derivative_store.load(slide, size)
+        if image is None:
+            image = self.slides.decode(index, size)
+            derivative_store.save(slide, size, image)
+        return image
+
+    def regenerate_slide_derivatives(self, slides: SlideCatalogue):
+        """古い縮小版を削除し、前回の表示領域に合わせた縮小版のうち、ないものを作る (起動時にバックグラウンドで実行)"""
+        removed = derivative_store.validate(slides.entries)
+        if removed:
+            print(f"古いスライドの縮小版を {removed} 件削除しました。")
+        box = derivative_store.display_box()
+        if box is None:
+            return # まだ一度も表示していない
+        created = 0
+        for index, slide in enumerate(slides.entries):
+            if slides is not self.slides:
+                return # スライドが読み込み直された
+            try:
+                size = fit_size(slides.image_size(index), box)
+                if not derivative_store.contains(slide, size):
+                    derivative_store.save(slide, size, slides.decode(index, size))
+                    created += 1
+            except Exception as e:
+                print(f"スライド '{slide.path}' の縮小版の作成中にエラー: {e}")
+        derivative_store.flush()
+        if created:
+            print(f"スライドの縮小版を {created} 件作成しました。")
 
     def next_slide(self):
         """次のスライドに切り替える"""
-        if not self.slideshow_pil_images:
+        if not self.slides:
             return
-        self.current_slide_index = (self.current_slide_index + 1) % len(self.slideshow_pil_images)
+        self.current_slide_index = (self.current_slide_index + 1) % len(self.slides)
         self.update_slide()
 
     def start_slideshow_playback(self):
         """スライドショーの再生を開始する"""
-        if not self.slideshow_playing and self.slideshow_pil_images:
+        if not self.slideshow_playing and self.slides:
             # スライドショーのウィジェットを表示する
             self.slideshow_label.pack(pady=10, expand=True, fill=tk.BOTH) # ここで表示
 
@@ -480,15 +794,15 @@ class VoiceChatApp:
             self.next_slide()
             self.slideshow_after_id = self.master.after(self.slideshow_interval_ms, self.slideshow_button_loop)
 
-    def resize_slideshow_label(self, width, height):
+    def resize_slideshow_label(self, width, height, preview=False):
         """スライドショー表示ラベルのサイズを変更する"""
         # ラベルのサイズを設定 (packで配置しているため、width/heightは優先されない場合がある)
         # しかし、update_slideでこのサイズを基準にリサイズするように修正
         # self.slideshow_label.config(width=width, height=height) # 直接設定は pack_forget/pack と競合しやすいため削除
-        self.update_slide() # 画像を現在のラベルサイズに合わせて再表示 (winfo_width/heightで実際のサイズを取得する)
+        self.update_slide(preview) # 画像を現在のラベルサイズに合わせて再表示 (winfo_width/heightで実際のサイズを取得する)
 
-    def resize_vroid_image(self, width=None, height=None):
-        """通常のVRoid画像をリサイズして表示する"""
+    def resize_vroid_image(self, width=None, height=None, preview=False):
+        """通常のVRoid画像をリサイズして表示する (previewなら軽い補間で仮表示する)"""
         if self.vroid_image_original:
             if width is None or height is None:
                 # デフォルトのVRoid画像サイズをウィンドウの高さの約30%に設定
@@ -519,12 +833,15 @@ class VoiceChatApp:
             if new_height <= 0: new_height = 1
 
             try:
-                resized_image = self.vroid_image_original.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                self.vroid_photo = ImageTk.PhotoImage(resized_image)
+                if preview:
+                    self.vroid_photo = image_cache.preview(self.vroid_image_original, (new_width, new_height), resize_preview_filter)
+                else:
+                    self.vroid_photo = image_cache.get(self.vroid_image_original, (new_width, new_height))
                 self.vroid_label.config(image=self.vroid_photo)
             except Exception as e:
                 print(f"VRoid画像のリサイズ中にエラー: {e}")
 
+    @tracer.traced(log_threshold_ms=frame_log_threshold_ms)
     def _play_speaking_animation_video(self):
         """動画のフレームを定期的に更新して表示する"""
         if self.is_talking and self.cap and self.cap.isOpened():
@@ -555,7 +872,9 @@ class VoiceChatApp:
                     resized_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
                     self.speaking_vroid_photo = ImageTk.PhotoImage(resized_image)
                     self.vroid_label.config(image=self.speaking_vroid_photo)
+                    tracer.count("video.frames")
                 except Exception as e:
+                    tracer.count("video.frame_errors")
                     print(f"動画フレームの処理または表示中にエラー: {e}")
             else:
                 # 動画の再生が終了したら、ループを停止し、元の画像に戻す
@@ -600,10 +919,11 @@ class VoiceChatApp:
             self._end_speaking_animation()
 
 
-    def on_resize(self, event):
-        # ウィンドウサイズ変更時に、VRoidとスライドショーの両方を調整
+    @tracer.traced(log_threshold_ms=frame_log_threshold_ms)
+    def on_resize(self, width, height, preview=False):
+        # ウィンドウサイズ変更時に、VRoidとスライドショーの両方を調整 (ResizeSchedulerから呼ばれる。previewはドラッグ中の仮表示)
         if not self.is_talking: # 会話中でなければ通常のVRoid画像をリサイズ
-            self.resize_vroid_image(event.width, int(event.height * 0.3)) # ウィンドウの新しい幅と高さを使用
+            self.resize_vroid_image(width, int(height * 0.3), preview) # ウィンドウの新しい幅と高さを使用
         else:
             # 会話中は動画が表示されているが、ここでは特に何もしない。
             # _start_speaking_animationで適切なサイズに調整されるため。
@@ -611,16 +931,19 @@ class VoiceChatApp:
 
         # スライドショーのラベルサイズを現在のウィンドウサイズに合わせて調整 (update_slideで画像も再調整される)
         if self.slideshow_playing or self.slideshow_label.winfo_ismapped(): # 表示されている場合のみ
-            self.resize_slideshow_label(event.width, int(event.height * 0.4)) # 例: ウィンドウ高さの40%をスライドショーに割り当てる
+            self.resize_slideshow_label(width, int(height * 0.4), preview) # 例: ウィンドウ高さの40%をスライドショーに割り当てる
 
     def send_message(self, event=None):
         message = self.input_entry.get()
         if message:
             self.update_chat_log(f"あなた: {message}")
             self.input_entry.delete(0, tk.END)
-            response_text = generate_response(message)
-            self.update_chat_log(f"AI: {response_text}", "blue")
-            self.speak(response_text) # 非同期で実行されるspeak関数を呼び出す
+            intent_match = match_intent(message)
+            if intent_match.intent is None:
+                self.speak_generated(message) # 意図の表にない発言は応答バックエンドで生成する
+                return
+            self.update_chat_log(f"AI: {intent_match.response}", "blue")
+            self.speak(intent_match.response, intent_match.action) # 非同期で実行されるspeak関数を呼び出す
 
     def start_conversation(self):
         if self.microphone is None:
@@ -641,14 +964,98 @@ class VoiceChatApp:
             self.conversation_thread.start()
 
     def conversation_loop_gui(self):
+        """会話スレッド: 発話を1つずつ認識して応答する (is_talkingがFalseになるまで続ける)"""
+        if self.capture is not None:
+            self.capture.clear() # 会話を始める前の発話は使わない
+        while self.is_talking:
+            speech_response = self.listen_once()
+            if speech_response is not None and not self.handle_speech_response(speech_response):
+                break
         # 会話が停止された場合はループを抜ける
-        if not self.is_talking:
-            self._end_speaking_animation() # 会話が停止されたらすぐにアニメーションを終了
-            return
-
+        self.master.after(0, self._end_speaking_animation) # 会話が停止されたらすぐにアニメーションを終了
+
+    def listen_once(self) -> dict | None:
+        """次の発話を認識する (常時録音中に発話がないまま待ち時間が過ぎたらNone)"""
+        if self.capture is None or not self.capture.running:
+            self.update_chat_log("-" * 20)
+            return recognize_speech_from_mic(self.recognizer, self.microphone, self.noise_tracker, speech_backend)
+        if streaming_recognition and speech_backend.supports_streaming:
+            return self.listen_streaming()
+        audio = self.capture.get_utterance(timeout=0.5) # 停止されたかを定期的に確認する
+        if audio is None:
+            return None
         self.update_chat_log("-" * 20)
-        speech_response = recognize_speech_from_mic(self.recognizer, self.microphone)
-
+        return recognize_audio(self.recognizer, audio, speech_backend)
+
+    def listen_streaming(self) -> dict | None:
+        """話している途中から認識して途中結果を表示する (安定したキーワードがあれば発話の終わりを待たずに返す)"""
+        stream = None
+        stream_start = None
+        position = 0
+        partial = ""
+        partial_since = 0.0
+        try:
+            while self.is_talking:
+                audio = self.capture.get_utterance(timeout=0.1)
+                if audio is not None:
+                    self.master.after(0, lambda: self.show_partial_transcript(None))
+                    if audio.start_frame == self.early_response_start:
+                        return None # 途中結果ですでに応答した発話
+                    self.update_chat_log("-" * 20)
+                    if stream is None or stream_start != audio.start_frame:
+                        return recognize_audio(self.recognizer, audio, speech_backend)
+                    frames = self.capture.read_frames(position, audio.end_frame)
+
+                    def finish_stream():
+                        stream.feed(frames.tobytes()) # 発話の終わりまでの残りを渡す
+                        return stream.finish()
+
+                    return run_recognition(speech_backend.name, finish_stream)
+
+                speech_start = self.capture.current_speech_start()
+                if speech_start is not None and speech_start == self.early_response_start:
+                    continue # 先に応答した発話の続きは認識しない
+                if speech_start is None:
+                    if stream is not None: # 短すぎる音などで発話にならなかった
+                        stream.close()
+                        stream = None
+                        self.master.after(0, lambda: self.show_partial_transcript(None))
+                    continue
+                if stream is None or stream_start != speech_start:
+                    if stream is not None:
+                        stream.close()
+                        stream = None
+                    try:
+                        stream = speech_backend.start_stream(self.capture.sample_rate, self.capture.sample_width)
+                    except sr.RequestError as e:
+                        print(f"ストリーミング認識を開始できません: {e}", file=sys.stderr)
+                        return None
+                    stream_start = position = speech_start
+                    partial = ""
+
+                frames = self.capture.read_frames(position, self.capture.written)
+                position += len(frames)
+                with tracer.span("recognize.partial"):
+                    text = stream.feed(frames.tobytes())
+                if text != partial:
+                    partial = text
+                    partial_since = time.monotonic()
+                    self.master.after(0, lambda t=text: self.show_partial_transcript(t))
+                elif (partial and stream_start != self.early_response_start and has_response_keyword(partial)
+                      and time.monotonic() - partial_since >= early_response_stable):
+                    # 安定した途中結果で先に応答する (この発話の最終結果は捨てる)
+                    tracer.count("recognize.early_response")
+                    self.early_response_start = stream_start
+                    self.master.after(0, lambda: self.show_partial_transcript(None))
+                    self.update_chat_log("-" * 20)
+                    return {"success": True, "error": None, "transcription": partial}
+            return None
+        finally:
+            if stream is not None:
+                stream.close() # 途中結果で先に応答したときなど、finishしていない認識も解放する
+
+    def handle_speech_response(self, speech_response: dict) -> bool:
+        """認識結果に応答する (会話を終える場合はFalse)"""
         user_input = None
         if speech_response["success"]:
             user_input = speech_response["transcription"]
@@ -661,23 +1068,31 @@ class VoiceChatApp:
                 self.speak(response_text)
         elif not speech_response["success"]:
             self.update_chat_log(f"音声認識エラー: {speech_response['error']}", "red")
-            self.speak("すみません、音声の認識で問題がありました。")
-
-        if user_input and ("さようなら" in user_input or "バイバイ" in user_input):
-            response_text = "はい、さようなら。またお話ししましょう。"
-            self.update_chat_log(f"AI: {response_text}", "blue")
-            self.speak(response_text)
-            self.stop_conversation()
-            return
+            self.speak(RECOGNITION_ERROR_RESPONSE)
 
         if user_input:
-            response_text = generate_response(user_input)
-            self.update_chat_log(f"AI: {response_text}", "blue")
-            self.speak(response_text)
+            intent_match = match_intent(user_input)
+            if intent_match.intent is None:
+                self.speak_generated(user_input)
+                return self.is_talking
+            self.update_chat_log(f"AI: {intent_match.response}", "blue")
+            self.speak(intent_match.response, intent_match.action)
+            if intent_match.action == "end_conversation":
+                self.stop_conversation()
+                return False
 
         # 会話を続けるために再度音声認識を開始 (ただし、is_talkingがTrueの場合のみ)
-        if self.is_talking:
-            self.master.after(100, self.conversation_loop_gui) # 0.1秒後に再度実行
+        return self.is_talking
+
+    def on_barge_in(self):
+        """発話中に利用者が話し始めたら、再生とアニメーションをすぐに止める (録音スレッドから呼ばれる)"""
+        if not self.is_talking:
+            return
+        tracer.count("speak.barge_in")
+        speech_pipeline.interrupt() # 合成待ちの文を破棄
+        playback.interrupt() # 再生中の音声もすぐに止める
+        self.master.after(0, self._end_speaking_animation)
+        self.master.after(0, lambda: self.update_chat_log("(割り込みを検出しました)", "purple"))
 
     def stop_conversation(self):
         if self.is_talking:
@@ -695,8 +1110,22 @@ class VoiceChatApp:
             self.stop_button.config(state=tk.DISABLED)
             self.force_stop_button.config(state=tk.DISABLED)
             self.update_chat_log("会話を強制終了します。", "purple") # 強制終了を目立たせる
+            speech_pipeline.interrupt() # 再生待ちの文を破棄
+            playback.interrupt() # 再生中の音声もすぐに止める
             self._end_speaking_animation() # 強制終了時にアニメーションも終了
 
+    def show_partial_transcript(self, text: str | None):
+        """認識途中の結果をチャットログの末尾に表示する (Noneなら消す)"""
+        self.chat_log.config(state=tk.NORMAL)
+        ranges = self.chat_log.tag_ranges("partial")
+        if ranges:
+            self.chat_log.delete(ranges[0], ranges[1])
+        if text:
+            self.chat_log.insert(tk.END, f"あなた (認識中): {text}\n", "partial")
+            self.chat_log.tag_config("partial", foreground="gray")
+            self.chat_log.see(tk.END)
+        self.chat_log.config(state=tk.DISABLED)
+
     def update_chat_log(self, message, color="black"):
         self.chat_log.config(state=tk.NORMAL)
         self.chat_log.insert(tk.END, message + "\n", color)
@@ -707,50 +1136,112 @@ class VoiceChatApp:
         self.chat_log.tag_config("green", foreground="green")
         self.chat_log.tag_config("purple", foreground="purple") # 強制終了用の色
 
+    def open_stats_panel(self):
+        """処理時間の統計ウィンドウを開く (開いていれば前面に出す)"""
+        if self.stats_panel is not None and self.stats_panel.is_open():
+            self.stats_panel.window.lift()
+            return
+        self.stats_panel = StatsPanel(self.master, tracer)
+
     def close_window(self):
         """ウィンドウを閉じる"""
         self.stop_slideshow_playback() # ウィンドウを閉じるときにスライドショーを停止
+        self.resize_scheduler.cancel()
         self._end_speaking_animation() # 念のため動画も停止
+        print(f"音声キャッシュ統計: {audio_cache.stats()}") # キャッシュサイズ調整の目安
+        print(f"音声クエリキャッシュ統計: {query_cache.stats()}")
+        print(f"画像キャッシュ統計: {image_cache.stats()}")
+        print(f"スライド先読み統計: {self.slide_prefetcher.stats()}")
+        print(f"スライド縮小版統計: {derivative_store.stats()}")
+        self.slide_prefetcher.shutdown()
+        derivative_store.flush() # 元画像の大きさの記録を次回の起動で使う
+        print(f"リサイズ処理: 仮表示 {self.resize_scheduler.previews} 回, 高品質 {self.resize_scheduler.settles} 回")
+        if self.capture is not None:
+            self.capture.stop()
+        if self.noise_tracker is not None:
+            self.noise_tracker.stop()
+        speech_backend.close()
+        speech_pipeline.interrupt() # 生成中の応答の受信も止める
+        try:
+            engine_loop.submit(response_router.close()).result(timeout=1)
+        except Exception as e:
+            print(f"応答バックエンドの終了中にエラー: {e}")
+        speech_pipeline.shutdown()
+        playback.close()
+        try:
+            engine_loop.submit(async_voicevox.close()).result(timeout=1)
+        except Exception as e:
+            print(f"VOICEVOX接続の終了中にエラー: {e}")
+        engine_loop.stop()
+        tracer.close()
         self.master.destroy()
 
-    def speak(self, text: str):
-        """テキストをVOICEVOXでA音声化して再生するヘルパー関数（非同期で実行）"""
+    @tracer.traced()
+    def speak(self, text: str, action: str | None = None):
+        """テキストをVOICEVOXでA音声化して再生するヘルパー関数（非同期で実行）。actionは意図の表の動作名"""
         # GUI更新はメインスレッドで行う
         # 発話が始まる前に、動画アニメーションを開始
         self.master.after(0, self._start_speaking_animation)
         self.master.after(0, lambda: self.update_chat_log("AI [発話中]..."))
 
-        # 音声合成と再生は別スレッドで実行
-        def actual_speak_process():
-            # ウィンドウサイズ変更コマンドの処理は、音声合成前に実行
-            if "大きく" in text:
-                self.master.after(0, lambda: self.master.geometry("700x600"))
-            elif "小さく" in text:
-                self.master.after(0, lambda: self.master.geometry("500x400"))
-            elif "スライドショー開始" in text:
-                self.master.after(0, self.start_slideshow_playback)
-            elif "スライドショー停止" in text:
-                self.master.after(0, self.stop_slideshow_playback)
-            elif "次のスライド" in text:
-                self.master.after(0, self.next_slide)
-
-            query = post_audio_query(text)
-            if query:
-                wav = post_synthesis(query)
-                if wav:
-                    play_wavfile(wav)
-                    # サイズ変更コマンドの場合、音声再生後に元のサイズに戻す
-                    if "大きく" in text or "小さく" in text:
-                        self.master.after(2000, lambda: self.master.geometry("950x1080")) # 初期サイズに戻す
-                else:
-                    self.master.after(0, lambda: print(">> 音声合成に失敗しました。", file=sys.stderr))
+        # 音声合成と再生はバックグラウンドのイベントループで実行
+        @tracer.traced()
+        async def actual_speak_process():
+            # ウィンドウサイズ変更などの動作は、音声合成前に実行
+            if action in self.intent_actions:
+                self.master.after(0, self.intent_actions[action])
+
+            mode = synthesis_mode # 実行時の設定を1度だけ読み、合成方法と記録を一致させる
+            if mode == "batch":
+                # 全文を1回の一括合成にまとめてから再生する
+                metrics = await speech_pipeline.speak_batch_async(text)
             else:
-                self.master.after(0, lambda: print(">> 音声クエリの作成に失敗しました。", file=sys.stderr))
-            
-            # 発話が終了したら、動画アニメーションを停止
-            self.master.after(0, self._end_speaking_animation)
+                # 文単位で合成し、最初の文ができた時点で再生を始める (キャッシュ済みの文は即再生)
+                metrics = await speech_pipeline.speak_async(text)
+            self._after_speech(metrics, mode, action)
 
-        threading.Thread(target=actual_speak_process).start()
+        engine_loop.submit(actual_speak_process())
+
+    @tracer.traced()
+    def speak_generated(self, user_text: str):
+        """意図の表にない発言への応答を応答バックエンドで生成し、文ができたものから読み上げる（非同期で実行）"""
+        self.master.after(0, self._start_speaking_animation)
+        self.master.after(0, lambda: self.update_chat_log("AI [応答を生成中]..."))
+        backend_names = [] # 応答したバックエンド (ルーターが決めた時点で追加される)
+
+        @tracer.traced()
+        async def actual_generate_process():
+            pieces = response_router.stream(user_text, on_backend=backend_names.append)
+            metrics = await speech_pipeline.speak_stream_async(pieces)
+            backend_name = backend_names[-1] if backend_names else "none"
+            tracer.count(f"respond.{backend_name}")
+            if metrics["text"]:
+                self.master.after(0, lambda: self.update_chat_log(f"AI ({backend_name}): {metrics['text']}", "blue"))
+            self._after_speech(metrics, backend_name)
+
+        engine_loop.submit(actual_generate_process())
+
+    def _after_speech(self, metrics: dict, mode: str, action: str | None = None):
+        """読み上げの計測値を記録し、再生が終わったら後片付けをする (合成に失敗した場合はすぐに片付ける)"""
+        if metrics["chunks_played"]:
+            def on_playback_done():
+                # 最初の音の時刻は再生側が記録する (鳴る前に割り込みで止めた場合はNone)
+                if metrics["time_to_first_sound"] is not None:
+                    tracer.record("time_to_first_sound", metrics["time_to_first_sound"], chunks=metrics["chunks"], mode=mode)
+                    print(f"最初の音までの時間: {metrics['time_to_first_sound'] * 1000:.0f} ms "
+                          f"(再生に渡すまで {metrics['time_to_first_chunk'] * 1000:.0f} ms, "
+                          f"全{metrics['chunks']}文, 合成 {metrics['total_time'] * 1000:.0f} ms)")
+                # サイズ変更コマンドの場合、音声再生後に元のサイズに戻す
+                if action in ("enlarge_window", "shrink_window"):
+                    self.master.after(2000, lambda: self.master.geometry("950x1080")) # 初期サイズに戻す
+                # 音声が鳴り終わった時点で動画アニメーションを停止
+                self.master.after(0, self._end_speaking_animation)
+
+            playback.call_when_done(on_playback_done)
+        else:
+            tracer.count("speak.synthesis_failed")
+            self.master.after(0, lambda: print(">> 音声合成に失敗しました。", file=sys.stderr))
+            self.master.after(0, self._end_speaking_animation)
 
     def _start_speaking_animation(self):
         """VRoidキャラクターの動画アニメーションを開始する"""
@@ -1,62 +1,43 @@
 import tkinter as tk
 from tkinter import ttk
-import requests
-import json
 import sounddevice as sd
-import numpy as np
 import speech_recognition as sr
-import time
 import sys
 import threading
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 
 import os
+from voicevox_client import VoicevoxClient
+from wav_utils import decode_wav
+from image_cache import ResizedImageCache
+from resize_scheduler import ResizeScheduler
 
 # --- VOICEVOX関連の設定 ---
 host = "127.0.0.1"
 port = "50021"
 speaker = 8 # 話者を指定 (例: 8 つむぎ)
+pool_size = 4 # キープアライブ接続の最大数
+retries = 2 # 接続失敗・5xx時の再試行回数
+backoff_factor = 0.2 # 再試行間隔の係数 (秒)
+
+# 発話ごとにTCP接続を張り直さないよう、同じクライアントを使い回す
+voicevox = VoicevoxClient(host, port, speaker, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
 
 def post_audio_query(text: str) -> dict | None:
     """音声合成用のクエリを作成する"""
-    params = {"text": text, "speaker": speaker}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/audio_query",
-            params=params,
-            timeout=10 # タイムアウト設定
-        )
-        res.raise_for_status() # エラーがあれば例外を発生
-        return res.json()
-    except requests.exceptions.RequestException as e:
-        print(f"\nAudio Queryエラー: {e}")
-        return None
+    return voicevox.audio_query(text)
 
 def post_synthesis(query_data: dict) -> bytes | None:
     """音声合成を実行する"""
-    params = {"speaker": speaker}
-    headers = {"content-type": "application/json"}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/synthesis",
-            data=json.dumps(query_data),
-            params=params,
-            headers=headers,
-            timeout=20 # タイムアウト設定 (合成は時間がかかる場合がある)
-        )
-        res.raise_for_status()
-        return res.content
-    except requests.exceptions.RequestException as e:
-        print(f"\nSynthesisエラー: {e}")
-        return None
+    return voicevox.synthesis(query_data)
 
 def play_wavfile(wav_data: bytes | None):
     """音声を再生する"""
     if wav_data is None:
         return
     try:
-        sample_rate = 24000 # VOICEVOXのデフォルトサンプリングレート
-        wav_array = np.frombuffer(wav_data, dtype=np.int16)
+        # ヘッダーを解釈し、PCM部分だけをエンジンが返した形式のまま再生する
+        wav_array, sample_rate = decode_wav(wav_data)
         sd.play(wav_array, sample_rate)
         sd.wait() # 再生が終わるまで待つ
     except Exception as e:
@@ -135,6 +116,15 @@ def generate_response(user_text: str | None) -> str:
     else:
         return "すみません、うまく聞き取れませんでした。もう一度お願いします。"
 
+# --- 画像表示の設定 ---
+# スライドやキャラクター画像のリサイズ結果を、表示サイズごとに保持する (ウィンドウサイズが変わらなければ再利用)
+image_cache_max_bytes = 64 * 1024 * 1024 # 保持するリサイズ済み画像の合計サイズの上限
+image_cache = ResizedImageCache(image_cache_max_bytes)
+# ウィンドウのリサイズ: ドラッグ中は1フレームに1回だけ軽い補間で描き、止まってから高品質で描き直す
+resize_frame_ms = 16 # ドラッグ中の再配置の間隔 (ミリ秒)
+resize_settle_ms = 150 # サイズ変更がこの時間止まったら高品質で描き直す (ミリ秒)
+resize_preview_filter = Image.Resampling.BILINEAR # ドラッグ中の補間方法 (さらに軽くするならNEAREST)
+
 class VoiceChatApp:
     def __init__(self, master):
         self.master = master # ルートウィンドウへの参照を保存
@@ -301,7 +291,10 @@ class VoiceChatApp:
         self.is_talking = False
         self.conversation_thread = None
 
-        master.bind("<Configure>", self.on_resize)
+        # <Configure>は子ウィジェットの分やドラッグの1ピクセルごとにも届くので、まとめてから再配置する
+        self.resize_scheduler = ResizeScheduler(master, lambda width, height: self.on_resize(width, height, preview=True),
+                                                self.on_resize, frame_ms=resize_frame_ms, settle_ms=resize_settle_ms)
+        master.bind("<Configure>", self.resize_scheduler.on_configure)
 
         # --- スライドショー表示用の設定 ---
         self.slideshow_label = tk.Label(master)
@@ -375,8 +368,8 @@ class VoiceChatApp:
         if not self.slideshow_pil_images:
             print("スライドショーに表示する画像がありません。")
 
-    def update_slide(self):
-        """現在のスライドを表示する"""
+    def update_slide(self, preview=False):
+        """現在のスライドを表示する (previewなら軽い補間で仮表示する)"""
         if not self.slideshow_pil_images:
             self.slideshow_label.config(image='')
             self.slideshow_label.image = None # 参照をクリア
@@ -416,8 +409,10 @@ class VoiceChatApp:
         if new_height == 0: new_height = 1
 
         try:
-            resized_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-            tk_image = ImageTk.PhotoImage(resized_image)
+            if preview:
+                tk_image = image_cache.preview(pil_image, (new_width, new_height), resize_preview_filter)
+            else:
+                tk_image = image_cache.get(pil_image, (new_width, new_height)) # 同じサイズなら2周目からはリサイズしない
             self.slideshow_label.config(image=tk_image)
             self.slideshow_label.image = tk_image # ガベージコレクションを防ぐための参照保持
         except Exception as e:
@@ -463,15 +458,15 @@ class VoiceChatApp:
             self.next_slide()
             self.slideshow_after_id = self.master.after(self.slideshow_interval_ms, self.slideshow_button_loop)
 
-    def resize_slideshow_label(self, width, height):
+    def resize_slideshow_label(self, width, height, preview=False):
         """スライドショー表示ラベルのサイズを変更する"""
         # ラベルのサイズを設定 (packで配置しているため、width/heightは優先されない場合がある)
         # しかし、update_slideでこのサイズを基準にリサイズするように修正
         # self.slideshow_label.config(width=width, height=height) # 直接設定は pack_forget/pack と競合しやすいため削除
-        self.update_slide() # 画像を現在のラベルサイズに合わせて再表示 (winfo_width/heightで実際のサイズを取得する)
+        self.update_slide(preview) # 画像を現在のラベルサイズに合わせて再表示 (winfo_width/heightで実際のサイズを取得する)
 
-    def resize_vroid_image(self, width=None, height=None):
-        """通常のVRoid画像をリサイズして表示する"""
+    def resize_vroid_image(self, width=None, height=None, preview=False):
+        """通常のVRoid画像をリサイズして表示する (previewなら軽い補間で仮表示する)"""
         if self.vroid_image_original:
             if width is None or height is None:
                 # デフォルトのVRoid画像サイズをウィンドウの高さの約30%に設定
@@ -502,8 +497,10 @@ class VoiceChatApp:
             if new_height <= 0: new_height = 1
 
             try:
-                resized_image = self.vroid_image_original.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                self.vroid_photo = ImageTk.PhotoImage(resized_image)
+                if preview:
+                    self.vroid_photo = image_cache.preview(self.vroid_image_original, (new_width, new_height), resize_preview_filter)
+                else:
+                    self.vroid_photo = image_cache.get(self.vroid_image_original, (new_width, new_height))
                 self.vroid_label.config(image=self.vroid_photo)
             except Exception as e:
                 print(f"VRoid画像のリサイズ中にエラー: {e}")
@@ -530,16 +527,15 @@ class VoiceChatApp:
             if new_height <= 0: new_height = 1
 
             try:
-                resized_image = self.speaking_vroid_image_original.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                self.speaking_vroid_photo = ImageTk.PhotoImage(resized_image) # ここで参照を保持**
+                self.speaking_vroid_photo = image_cache.get(self.speaking_vroid_image_original, (new_width, new_height)) # ここで参照を保持**
                 self.vroid_label.config(image=self.speaking_vroid_photo)
             except Exception as e:
                 print(f"発話中のVRoid画像のリサイズ中にエラー: {e}")
 
-    def on_resize(self, event):
-        # ウィンドウサイズ変更時に、VRoidとスライドショーの両方を調整
+    def on_resize(self, width, height, preview=False):
+        # ウィンドウサイズ変更時に、VRoidとスライドショーの両方を調整 (ResizeSchedulerから呼ばれる。previewはドラッグ中の仮表示)
         if not self.is_talking: # 会話中でなければ通常のVRoid画像をリサイズ
-            self.resize_vroid_image(event.width, int(event.height * 0.3)) # ウィンドウの新しい幅と高さを使用
+            self.resize_vroid_image(width, int(height * 0.3), preview) # ウィンドウの新しい幅と高さを使用
         else:
             # 会話中はVto.pngが表示されているが、ここでは特に何もしない。
             # _start_speaking_animationで適切なサイズに調整されるため。
@@ -547,7 +543,7 @@ class VoiceChatApp:
             
         # スライドショーのラベルサイズを現在のウィンドウサイズに合わせて調整 (update_slideで画像も再調整される)
         if self.slideshow_playing or self.slideshow_label.winfo_ismapped(): # 表示されている場合のみ
-            self.resize_slideshow_label(event.width, int(event.height * 0.4)) # 例: ウィンドウ高さの40%をスライドショーに割り当てる
+            self.resize_slideshow_label(width, int(height * 0.4), preview) # 例: ウィンドウ高さの40%をスライドショーに割り当てる
 
     def send_message(self, event=None):
         message = self.input_entry.get()
@@ -646,6 +642,8 @@ class VoiceChatApp:
     def close_window(self):
         """ウィンドウを閉じる"""
         self.stop_slideshow_playback() # ウィンドウを閉じるときにスライドショーを停止
+        self.resize_scheduler.cancel()
+        print(f"画像キャッシュ統計: {image_cache.stats()}")
         self.master.destroy()
 
     def speak(self, text: str):
@@ -1,62 +1,47 @@
 import tkinter as tk
 from tkinter import ttk
-import requests
-import json
 import sounddevice as sd
-import numpy as np
 import speech_recognition as sr
-import time
 import sys
 import threading
 from PIL import Image, ImageTk, ImageDraw, ImageFont
 import cv2  # Import OpenCV
 import os
+from voicevox_client import VoicevoxClient
+from wav_utils import decode_wav
+from perf_trace import Tracer, StatsPanel
+
+# --- 計測 (トレース) の設定 ---
+trace_log_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "trace_途中経過ver1.jsonl")  # ローテーションするJSONLファイル
+frame_log_threshold_ms = 50  # 描画処理はこの時間を超えたフレームだけファイルに記録する (集計は全フレーム)
+tracer = Tracer(trace_log_path)
 
 # --- VOICEVOX関連の設定 ---
 host = "127.0.0.1"
 port = "50021"
 speaker = 8  # 話者を指定 (例: 8 つむぎ)
+pool_size = 4  # キープアライブ接続の最大数
+retries = 2  # 接続失敗・5xx時の再試行回数
+backoff_factor = 0.2  # 再試行間隔の係数 (秒)
+
+# 発話ごとにTCP接続を張り直さないよう、同じクライアントを使い回す
+voicevox = VoicevoxClient(host, port, speaker, pool_size=pool_size, retries=retries, backoff_factor=backoff_factor)
 
 def post_audio_query(text: str) -> dict | None:
     """音声合成用のクエリを作成する"""
-    params = {"text": text, "speaker": speaker}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/audio_query",
-            params=params,
-            timeout=10  # タイムアウト設定
-        )
-        res.raise_for_status()  # エラーがあれば例外を発生
-        return res.json()
-    except requests.exceptions.RequestException as e:
-        print(f"\nAudio Queryエラー: {e}")
-        return None
+    return voicevox.audio_query(text)
 
 def post_synthesis(query_data: dict) -> bytes | None:
     """音声合成を実行する"""
-    params = {"speaker": speaker}
-    headers = {"content-type": "application/json"}
-    try:
-        res = requests.post(
-            f"http://{host}:{port}/synthesis",
-            data=json.dumps(query_data),
-            params=params,
-            headers=headers,
-            timeout=20  # タイムアウト設定 (合成は時間がかかる場合がある)
-        )
-        res.raise_for_status()
-        return res.content
-    except requests.exceptions.RequestException as e:
-        print(f"\nSynthesisエラー: {e}")
-        return None
+    return voicevox.synthesis(query_data)
 
 def play_wavfile(wav_data: bytes | None):
     """音声を再生する"""
     if wav_data is None:
         return
     try:
-        sample_rate = 24000  # VOICEVOXのデフォルトサンプリングレート
-        wav_array = np.frombuffer(wav_data, dtype=np.int16)
+        # ヘッダーを解釈し、PCM部分だけをエンジンが返した形式のまま再生する
+        wav_array, sample_rate = decode_wav(wav_data)
         sd.play(wav_array, sample_rate)
         sd.wait()  # 再生が終わるまで待つ
     except Exception as e:
@@ -64,6 +49,7 @@ def play_wavfile(wav_data: bytes | None):
         print("利用可能なオーディオデバイスを確認してください。")
 
 # --- 音声認識関連の関数 ---
+@tracer.traced()
 def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Microphone) -> dict:
     """マイクから音声を取得し、テキストに変換する"""
     if not isinstance(recognizer, sr.Recognizer):
@@ -81,11 +67,14 @@ def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Micropho
         print("\nマイクのノイズレベルを調整中...")
         try:
             # 実際の音声入力の直前にノイズ調整を行う
-            recognizer.adjust_for_ambient_noise(source, duration=1)  # 1秒間調整
+            with tracer.span("recognize.adjust_for_ambient_noise"):
+                recognizer.adjust_for_ambient_noise(source, duration=1)  # 1秒間調整
             print("どうぞ話してください（2-3秒間）...")
             # タイムアウトとフレーズ制限を短くして応答性を向上
-            audio = recognizer.listen(source, timeout=3, phrase_time_limit=3)
+            with tracer.span("recognize.listen"):
+                audio = recognizer.listen(source, timeout=3, phrase_time_limit=3)
         except sr.WaitTimeoutError:
+            tracer.count("recognize.timeout")
             response["success"] = False
             response["error"] = "タイムアウトしました。音声が検出されませんでした。"
             return response
@@ -95,11 +84,14 @@ def recognize_speech_from_mic(recognizer: sr.Recognizer, microphone: sr.Micropho
             return response
 
     try:
-        response["transcription"] = recognizer.recognize_google(audio, language='ja-JP')
+        with tracer.span("recognize.google"):
+            response["transcription"] = recognizer.recognize_google(audio, language='ja-JP')
     except sr.RequestError as e:
+        tracer.count("recognize.request_error")
         response["success"] = False
         response["error"] = f"Google APIに接続できませんでした; {e}"
     except sr.UnknownValueError:
+        tracer.count("recognize.unknown_value")
         response["error"] = "音声を認識できませんでした"
     except Exception as e:
         response["success"] = False
@@ -237,6 +229,12 @@ class VoiceChatApp:
         self.force_stop_button.pack(side=tk.LEFT, padx=5)
         self.force_stop_button.config(state=tk.DISABLED)
 
+        # 処理時間の統計を表示するボタン (F12キーでも開ける)
+        self.stats_panel = None
+        self.stats_button = ttk.Button(self.button_frame, text="統計", command=self.open_stats_panel)
+        self.stats_button.pack(side=tk.LEFT, padx=5)
+        master.bind("<F12>", lambda event: self.open_stats_panel())
+
         # --- 動画スライドショー制御ボタンを追加 ---
         self.slideshow_button_frame = ttk.Frame(master)
         self.slideshow_button_frame.pack(pady=5)
@@ -356,6 +354,7 @@ class VoiceChatApp:
             print(f"ロードされた動画ファイル: {self.video_files}")
 
 
+    @tracer.traced(log_threshold_ms=frame_log_threshold_ms)
     def update_video_frame(self):
         """動画のフレームを読み込み、表示する"""
         if self.is_video_slideshow_playing and self.current_video_cap and self.current_video_cap.isOpened():
@@ -395,8 +394,10 @@ class VoiceChatApp:
                     tk_image = ImageTk.PhotoImage(resized_image)
                     self.video_slideshow_label.config(image=tk_image)
                     self.video_slideshow_label.image = tk_image # ガベージコレクションを防ぐための参照保持
+                    tracer.count("video_slideshow.frames")
 
                 except Exception as e:
+                    tracer.count("video_slideshow.frame_errors")
                     print(f"動画フレームの処理または表示中にエラー: {e}")
                     self.stop_video_slideshow() # エラーが発生したら停止
                     return
@@ -551,6 +552,7 @@ class VoiceChatApp:
             self.is_video_playing_vroid = True
             self._play_speaking_animation_video()
 
+    @tracer.traced(log_threshold_ms=frame_log_threshold_ms)
     def _play_speaking_animation_video(self):
         """動画のフレームを定期的に更新して表示する"""
         if self.is_talking and self.cap and self.cap.isOpened() and self.is_video_playing_vroid:
@@ -579,7 +581,9 @@ class VoiceChatApp:
                     resized_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
                     self.speaking_vroid_photo = ImageTk.PhotoImage(resized_image)
                     self.vroid_label.config(image=self.speaking_vroid_photo)
+                    tracer.count("video.frames")
                 except Exception as e:
+                    tracer.count("video.frame_errors")
                     print(f"動画フレームの処理または表示中にエラー: {e}")
             else:
                 print("VRoid speaking_video の終わりに達しました。最初から再生します。")
@@ -724,24 +728,36 @@ class VoiceChatApp:
         self.chat_log.tag_config("purple", foreground="purple")  # 強制終了用の色
         self.chat_log.tag_config("orange", foreground="orange")
 
+    def open_stats_panel(self):
+        """処理時間の統計ウィンドウを開く (開いていれば前面に出す)"""
+        if self.stats_panel is not None and self.stats_panel.is_open():
+            self.stats_panel.window.lift()
+            return
+        self.stats_panel = StatsPanel(self.master, tracer)
+
 
     def close_window(self):
         """ウィンドウを閉じる"""
         self.stop_video_slideshow() # ウィンドウを閉じるときに動画スライドショーを停止
         self._end_speaking_animation() # VRoid Speaking動画も停止
+        tracer.close()
         self.master.destroy()
 
+    @tracer.traced()
     def speak(self, text: str):
         """テキストをVOICEVOXで音声化して再生するヘルパー関数（非同期で実行）"""
         # 発話が始まる前に、VRoid Speaking動画アニメーションを開始
         self.master.after(0, self._start_speaking_animation)
         self.master.after(0, lambda: self.update_chat_log("AI [発話中]..."))
 
-        query_data = post_audio_query(text)
+        with tracer.span("speak.audio_query"):
+            query_data = post_audio_query(text)
         if query_data:
-            wav_data = post_synthesis(query_data)
+            with tracer.span("speak.synthesis"):
+                wav_data = post_synthesis(query_data)
             if wav_data:
-                play_wavfile(wav_data)
+                with tracer.span("speak.play"):
+                    play_wavfile(wav_data)
             else:
                 self.update_chat_log("音声合成に失敗しました。", "red")
         else: